@@ -0,0 +1,50 @@
+# Stand-ins for discord.Interaction, so command coroutines can run without a Discord connection.
+import itertools
+
+import discord
+
+user_ids = itertools.count(200000000000000000)
+
+class FakeUser:
+    def __init__(self, name, id=None):
+        self.name = name
+        self.id = next(user_ids) if id is None else id
+        self.mention = f"<@{self.id}>"
+        self.dm_channel = None
+
+    async def send(self, *args, **kwargs):
+        pass
+
+class FakeResponse:
+    """Records what a command sent instead of sending it."""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, content=None, **kwargs):
+        self.messages.append((content, kwargs))
+
+    async def edit_message(self, **kwargs):
+        self.messages.append((None, kwargs))
+
+    async def defer(self, **kwargs):
+        pass
+
+    def is_done(self):
+        return bool(self.messages)
+
+class FakeInteraction:
+    type = discord.InteractionType.application_command
+
+    def __init__(self, user):
+        self.user = user
+        self.response = FakeResponse()
+
+    async def original_response(self):
+        return None
+
+async def run_command(command, user, *args, **kwargs):
+    """Runs an app command's coroutine as user and returns the interaction."""
+    ctx = FakeInteraction(user)
+    await command.callback(ctx, *args, **kwargs)
+    return ctx
@@ -0,0 +1,40 @@
+# Writes a splatwallet.csv full of made-up wallets for benchmarking.
+# Usage: python -m benchmarks.generate_wallets COUNT [OUTPUT] [--seed N]
+import argparse
+import csv
+import random
+
+fieldnames = ["address", "username", "nickname", "type", "owner", "balance", "share", "owner_id"]
+wallets_per_owner = 5 # on average
+
+def generate_rows(count, seed=0):
+    """Yields count valid wallet rows. The same seed always gives the same wallets."""
+    rng = random.Random(seed)
+    owners = max(count // wallets_per_owner, 1)
+    for number in range(count):
+        owner = rng.randrange(owners)
+        yield {
+            "address": "".join(rng.choice("0123456789abcdefABCDEF") for _ in range(40)),
+            "username": f"wallet{number}.ink",
+            "nickname": f"Wallet {number}",
+            "type": "Business" if rng.random() < 0.2 else "Person",
+            "owner": f"discord/owner{owner}",
+            "balance": str(int(rng.paretovariate(1.2) * 100)),
+            "share": "True" if rng.random() < 0.1 else "False",
+            "owner_id": str(100000000000000000 + owner)
+        }
+
+def write_csv(path, count, seed=0):
+    with open(path, "w", newline='') as profiles_csv:
+        writer = csv.DictWriter(profiles_csv, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(generate_rows(count, seed))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a splatwallet.csv full of made-up wallets.")
+    parser.add_argument("count", type=int, help="How many wallets to write, e.g. 1000 to 1000000.")
+    parser.add_argument("output", nargs="?", default="./data/splatwallet.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_csv(args.output, args.count, args.seed)
+    print(f"Wrote {args.count:,} wallets to {args.output}.")
@@ -0,0 +1,220 @@
+# Measures the bot's hot paths against generated wallets, without connecting to Discord.
+# Usage: python -m benchmarks.run_benchmarks [--wallets 1000 10000 100000] [--output results.json]
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None # not available on Windows
+
+from benchmarks import generate_wallets
+from benchmarks.fake_interaction import FakeUser, run_command
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def summarize(durations):
+    """Turns a list of durations in seconds into mean/p50/p99 in microseconds."""
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "mean_us": sum(durations) / len(durations) * 1e6,
+        "p50_us": durations[len(durations) // 2] * 1e6,
+        "p99_us": durations[min(int(len(durations) * 0.99), len(durations) - 1)] * 1e6
+    }
+
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # kilobytes everywhere but macOS
+
+def benchmark_records(bot, count):
+    """Compares a dict of strings per wallet, as the bot used to store them, with Wallet records."""
+    rows = list(generate_wallets.generate_rows(count))
+    for row in rows:
+        row['share'] = row['share'] == "True"
+
+    results = {}
+    for name, build, add_one in (
+        ("dict", dict, lambda profile: profile.__setitem__('balance', str(int(profile['balance']) + 1))),
+        ("wallet", bot.Wallet.from_row, lambda profile: setattr(profile, 'balance', profile.balance + 1))
+    ):
+        gc.collect()
+        tracemalloc.start()
+        profiles = [build(row) for row in rows]
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        for profile in profiles:
+            add_one(profile)
+        elapsed = time.perf_counter() - started
+        # The field strings are shared with rows, so this is the container cost per wallet
+        results[name] = {"bytes_per_wallet": memory / count, "balance_updates_per_second": count / elapsed}
+        del profiles
+    return results
+
+async def benchmark_async(bot, iterations):
+    results = {}
+    rng = random.Random(1)
+    bot.change_writer.start()
+
+    all_wallets = list(bot.wallets)
+    sample = [rng.choice(all_wallets) for _ in range(iterations)]
+    owners = [owner for owner, owned in bot.wallets.by_owner.items() if len(owned) >= 2]
+
+    # Lookups, half by username and half by address
+    keys = [profile.username if number % 2 else profile.address for number, profile in enumerate(sample)]
+    durations = []
+    for key in keys:
+        started = time.perf_counter()
+        bot.wallets.get(key)
+        durations.append(time.perf_counter() - started)
+    results['lookup'] = summarize(durations)
+
+    durations = []
+    for key in keys:
+        started = time.perf_counter()
+        bot.wallets.complete(key[:6], sample[0].owner)
+        durations.append(time.perf_counter() - started)
+    results['autocomplete'] = summarize(durations)
+
+    # Whole commands, as a user would run them
+    commands = {
+        "info": lambda number: run_command(bot.list_info, FakeUser("benchmark"), sample[number].username),
+        "mywallets": lambda number: run_command(bot.my_wallets, FakeUser(owners[number % len(owners)].split("/")[1])),
+        "new": lambda number: run_command(bot.new_wallet, FakeUser("benchmark"), "Benchmark", f"benchmark{number}.ink"),
+        "transfer": lambda number: transfer_between_own_wallets(bot, owners[number % len(owners)]),
+        "leaderboard": lambda number: run_command(bot.leaderboard, FakeUser("benchmark"), 10, "", sample[number].username),
+        "stats": lambda number: run_command(bot.stats, FakeUser("benchmark"))
+    }
+    results['commands'] = {}
+    for name, command in commands.items():
+        durations = []
+        for number in range(iterations):
+            started = time.perf_counter()
+            await command(number)
+            durations.append(time.perf_counter() - started)
+        results['commands'][name] = summarize(durations)
+
+    # Transfers through the engine alone
+    pairs = [list(bot.wallets.by_owner[owners[number % len(owners)]].values())[:2] for number in range(iterations)]
+    started = time.perf_counter()
+    for from_profile, to_profile in pairs:
+        await bot.transactions.transfer(from_profile, to_profile, 0)
+    results['transfer_throughput_per_second'] = iterations / (time.perf_counter() - started)
+
+    # write_changes only validates and queues; the write itself happens in flush
+    durations = []
+    for profile in sample:
+        started = time.perf_counter()
+        bot.write_changes(profile)
+        durations.append(time.perf_counter() - started)
+    results['write_changes'] = summarize(durations)
+
+    bot.write_changes(sample[0])
+    started = time.perf_counter()
+    await bot.change_writer.flush()
+    results['flush_seconds'] = time.perf_counter() - started
+
+    # A reload after something else changed one wallet in the database
+    await asyncio.get_running_loop().run_in_executor(bot.db_executor, lambda: None)
+    rows = [profile.to_row() for profile in bot.wallets]
+    rows[0]['balance'] = str(int(rows[0]['balance']) + 1)
+    if isinstance(bot.backend, bot.CSVBackend):
+        bot.write_snapshot(rows)
+    else:
+        bot.SQLiteBackend(bot.sqlite_file).save([rows[0]], [])
+    started = time.perf_counter()
+    await bot.reload_db()
+    results['reload_seconds'] = time.perf_counter() - started
+
+    bot.change_writer.task.cancel()
+    await asyncio.get_running_loop().run_in_executor(bot.db_executor, lambda: None)
+    return results
+
+async def transfer_between_own_wallets(bot, owner):
+    from_profile, to_profile = list(bot.wallets.by_owner[owner].values())[:2]
+    await run_command(bot.transfer, FakeUser(owner.split("/")[1]), from_profile.username, to_profile.username, 1)
+    # Send it back so the wallets never run dry
+    await bot.transactions.transfer(to_profile, from_profile, 1)
+
+def run_single(count, iterations):
+    """Benchmarks one database size in this process and returns the results."""
+    work_dir = tempfile.mkdtemp(prefix="splatchain-benchmark-")
+    os.chdir(work_dir)
+    os.makedirs("data")
+    generate_wallets.write_csv("./data/splatwallet.csv", count)
+
+    sys.path.insert(0, repo_dir)
+    import splatchain_discord as bot
+
+    results = {"wallets": count, "backend": os.getenv('DB_BACKEND', "csv")}
+    timings = {}
+    started = time.perf_counter()
+    bot.load_wallets(timings)
+    results['load'] = {"seconds": time.perf_counter() - started, **{f"{phase}_seconds": seconds for phase, seconds in timings.items()}}
+    results['peak_rss_after_load_bytes'] = peak_rss()
+
+    results.update(asyncio.run(benchmark_async(bot, iterations)))
+    results['records'] = benchmark_records(bot, count)
+    results['peak_rss_bytes'] = peak_rss()
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the bot against generated wallets.")
+    parser.add_argument("--wallets", type=int, nargs="+", default=[1000, 10000, 100000], help="Database sizes to benchmark, e.g. 1000 1000000.")
+    parser.add_argument("--iterations", type=int, default=1000, help="How many times to run each timed operation.")
+    parser.add_argument("--output", help="Where to write the JSON results (default: benchmarks/results/<time>.json).")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # Each size runs in its own process, so peak memory and module state start fresh
+        print(json.dumps(run_single(args.wallets[0], args.iterations)))
+        sys.exit()
+
+    runs = []
+    for count in args.wallets:
+        print(f"Benchmarking {count:,} wallets...")
+        process = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run_benchmarks", "--single", "--wallets", str(count), "--iterations", str(args.iterations)],
+            cwd=repo_dir, capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            print(process.stderr)
+            sys.exit(f"Benchmark for {count:,} wallets failed.")
+        run = json.loads(process.stdout.strip().splitlines()[-1])
+        runs.append(run)
+        print(f"  load {run['load']['seconds']:.2f}s, lookup p50 {run['lookup']['p50_us']:.1f}us, transfer {run['commands']['transfer']['p50_us']:.0f}us, "
+            f"flush {run['flush_seconds'] * 1000:.1f}ms, reload {run['reload_seconds'] * 1000:.1f}ms, "
+            f"{run['records']['wallet']['bytes_per_wallet']:.0f} bytes per Wallet vs {run['records']['dict']['bytes_per_wallet']:.0f} per dict")
+
+    output = args.output or os.path.join(repo_dir, "benchmarks", "results", f"{int(time.time())}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as results_file:
+        json.dump({
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": int(time.time()),
+            "runs": runs
+        }, results_file, indent=2)
+    print(f"Results written to {output}.")
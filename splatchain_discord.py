@@ -1,100 +1,777 @@
+import argparse
 import asyncio
+import bisect
+import contextlib
+import cProfile
 from time import sleep
+import aiohttp
 import discord
 from discord import app_commands
 from discord.ext import tasks
 import csv
+import enum
+import hashlib
+import itertools
+import json
 import re
 import secrets
+import signal
+import sys
+import sqlite3
+import threading
 import os
-import requests
+import pstats
+import time
+import tracemalloc
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 import yaml
 
 # Global variables
 db_file = "./data/splatwallet.csv"
-profiles = []
+journal_file = "./data/splatwallet.journal"
+sqlite_file = os.getenv('SQLITE_FILE', "./data/splatwallet.db")
 
-# Loading database
-def reload_db():
-    global profiles
-    with open(db_file, "r") as profiles_csv:
-        profiles = list(csv.DictReader(profiles_csv)).copy()
+# Journal mode appends each change to journal_file instead of rewriting db_file
+journal_enabled = os.getenv('JOURNAL_DB') == "true"
+journal_max_bytes = int(os.getenv('JOURNAL_MAX_BYTES', 1048576))
+journal_max_age = int(os.getenv('JOURNAL_MAX_AGE', 60)) # minutes
+journal_started = None # when the oldest record not yet folded into db_file was written
+
+# Changes are written in the background, batched over a short window
+write_debounce = float(os.getenv('WRITE_DEBOUNCE', 1.0)) # seconds
+write_max_delay = float(os.getenv('WRITE_MAX_DELAY', 5.0)) # seconds
+db_executor = ThreadPoolExecutor(max_workers=1) # all backend writes run here, one at a time
+
+# Sharded mode runs the bot as several processes, each connected with some of the shards, sharing one SQLite database
+shard_count = int(os.getenv('SHARD_COUNT', 0)) # 0 runs a single unsharded client
+shard_ids = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', "").split(",") if shard_id.strip()] or None # shards this process connects, all of them by default
+shared_db = shard_count > 0
+shared_db_poll_interval = float(os.getenv('SHARED_DB_POLL_INTERVAL', 1.0)) # seconds between checks for other processes' changes
+
+# Metrics
+metrics_port = int(os.getenv('METRICS_PORT', 0)) # serve Prometheus metrics on this port, 0 turns it off
+metrics_host = os.getenv('METRICS_HOST', "127.0.0.1")
+metrics_dump_interval = float(os.getenv('METRICS_DUMP_INTERVAL', 0)) # seconds between writes to metrics_file, 0 turns it off
+metrics_file = "./data/metrics.prom"
+latency_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # seconds
+
+metric_help = {
+    "splatchain_command_seconds": ("histogram", "Time from receiving a command to finishing it."),
+    "splatchain_response_seconds": ("histogram", "Time from receiving a command to it calling send_message."),
+    "splatchain_response_send_seconds": ("histogram", "Time send_message took to reach Discord."),
+    "splatchain_block_check_seconds": ("histogram", "Time spent checking the user against the block list."),
+    "splatchain_wallet_lookup_seconds": ("histogram", "Time spent finding a wallet by address or username."),
+    "splatchain_write_changes_seconds": ("histogram", "Time write_changes took to validate and queue changes."),
+    "splatchain_owner_dm_seconds": ("histogram", "Time spent finding an owner and sending them a notification."),
+    "splatchain_flush_seconds": ("histogram", "Time spent saving a batch of changes to the backend."),
+    "splatchain_flush_bytes_total": ("counter", "Bytes written to the database files by saves."),
+    "splatchain_flush_errors_total": ("counter", "Saves that failed and were retried later."),
+    "splatchain_reload_seconds": ("histogram", "Time spent checking for and loading outside changes to the database."),
+    "splatchain_block_list_fetch_seconds": ("histogram", "Time spent fetching the block list, including retries."),
+    "splatchain_block_list_fetches_total": ("counter", "Block list fetches by outcome."),
+    "splatchain_event_loop_lag_seconds": ("histogram", "How late a one-second sleep on the event loop woke up."),
+    "splatchain_wallets": ("gauge", "Wallets in the store.")
+}
+
+class Metrics:
+    """Counters, gauges and latency histograms, rendered in the Prometheus text format.
+
+    enabled is False unless a metrics output is configured, and every recording call returns
+    straight away in that case.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.values = {} # (name, labels) -> number for counters and gauges, [bucket counts..., sum, count] for histograms
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.values.get(key)
+        if histogram is None:
+            histogram = self.values[key] = [0] * (len(latency_buckets) + 3)
+        histogram[bisect.bisect_left(latency_buckets, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    def count(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def render(self):
+        lines = []
+        described = set()
+        for (name, labels), value in sorted(self.values.items()):
+            kind, help_text = metric_help.get(name, ("untyped", ""))
+            if name not in described:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+            
+            label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+            label_braces = f"{{{label_text}}}" if label_text else ""
+            if kind != "histogram":
+                lines.append(f"{name}{label_braces} {value}")
+                continue
+            
+            cumulative = 0
+            for bound, bucket_count in zip(latency_buckets + ("+Inf",), value):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{{{label_text}{',' if label_text else ''}le=\"{bound}\"}} {cumulative}")
+            lines.append(f"{name}_sum{label_braces} {value[-2]}")
+            lines.append(f"{name}_count{label_braces} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics(bool(metrics_port or metrics_dump_interval))
+
+# Wallet storage
+class WalletType(str, enum.Enum):
+    PERSON = "Person"
+    BUSINESS = "Business"
+
+    def __str__(self):
+        return self.value
+
+    def __format__(self, format_spec):
+        return format(self.value, format_spec)
+
+class Wallet:
+    """One wallet, with typed fields. Fields only become strings when written to storage."""
+
+    __slots__ = ("address", "username", "nickname", "type", "owner", "balance", "share", "owner_id")
+
+    def __init__(self, address, username="", nickname="", type=WalletType.PERSON, owner="", balance=0, share=False, owner_id=""):
+        self.address = address
+        self.username = username
+        self.nickname = nickname
+        self.type = WalletType(type)
+        # Many wallets share an owner, so they share one copy of the string
+        self.owner = sys.intern(owner)
+        self.balance = balance
+        self.share = share
+        self.owner_id = sys.intern(owner_id)
+
+    @classmethod
+    def from_row(cls, row):
+        """Builds a wallet from a row read from storage, where every field but share is a string."""
+        try:
+            balance = int(row['balance'])
+        except ValueError:
+            balance = 0 # not validated yet, counted as empty like profile_validator would
+        try:
+            type = WalletType(row['type'])
+        except ValueError:
+            type = WalletType.PERSON
+        return cls(row['address'], row['username'], row['nickname'], type, row['owner'], balance, row['share'] in (True, "True"), row.get('owner_id') or "")
+
+    @classmethod
+    def from_db(cls, row):
+        """Builds a wallet from a SQLite row in SQLiteBackend.columns order, whose balance and share are already numbers."""
+        address, username, nickname, type, owner, balance, share, owner_id = row
+        try:
+            type = WalletType(type)
+        except ValueError:
+            type = WalletType.PERSON
+        return cls(address, username, nickname, type, owner, balance, bool(share), owner_id)
+
+    def to_row(self):
+        return {
+            "address": self.address,
+            "username": self.username,
+            "nickname": self.nickname,
+            "type": self.type.value,
+            "owner": self.owner,
+            "balance": str(self.balance),
+            "share": self.share,
+            "owner_id": self.owner_id
+        }
+
+    def fields(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def copy(self, **changes):
+        return Wallet(**{**self.fields(), **changes})
+
+    def update(self, changes):
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.type = WalletType(self.type)
+        self.owner = sys.intern(self.owner)
+        self.owner_id = sys.intern(self.owner_id)
+
+    def __eq__(self, other):
+        if not isinstance(other, Wallet):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"Wallet({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+class SortedKeys:
+    """A sorted list kept as buckets of about bucket_size keys, like sortedcontainers' SortedList.
+
+    Adding or removing a key only shifts the keys in its own bucket, instead of every key after it.
+    maxes holds the last key of each bucket, so a key's bucket is found with a binary search.
+    """
+
+    bucket_size = 1000
+
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self.buckets = [keys[start:start + self.bucket_size] for start in range(0, len(keys), self.bucket_size)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.length = len(keys)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.buckets)
+
+    def add(self, key):
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self.length += 1
+            return
+        
+        number = min(bisect.bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[number]
+        bisect.insort(bucket, key)
+        self.maxes[number] = bucket[-1]
+        self.length += 1
+        if len(bucket) > self.bucket_size * 2:
+            # Split in half, so buckets stay small without being rebuilt often
+            self.buckets.insert(number + 1, bucket[self.bucket_size:])
+            del bucket[self.bucket_size:]
+            self.maxes[number] = bucket[-1]
+            self.maxes.insert(number + 1, self.buckets[number + 1][-1])
+
+    def remove(self, key):
+        """Removes key if it is there."""
+        number = bisect.bisect_left(self.maxes, key)
+        if number == len(self.buckets):
+            return
+        bucket = self.buckets[number]
+        position = bisect.bisect_left(bucket, key)
+        if position == len(bucket) or bucket[position] != key:
+            return
+        
+        del bucket[position]
+        self.length -= 1
+        if bucket:
+            self.maxes[number] = bucket[-1]
+        else:
+            del self.buckets[number]
+            del self.maxes[number]
+
+    def index(self, key):
+        """Returns how many keys sort before key."""
+        number = bisect.bisect_left(self.maxes, key)
+        before = sum(len(bucket) for bucket in itertools.islice(self.buckets, number))
+        if number < len(self.buckets):
+            before += bisect.bisect_left(self.buckets[number], key)
+        return before
+
+    def iterate_from(self, key):
+        """Yields the keys from key onwards, in order."""
+        number = bisect.bisect_left(self.maxes, key)
+        if number == len(self.buckets):
+            return
+        yield from itertools.islice(self.buckets[number], bisect.bisect_left(self.buckets[number], key), None)
+        for bucket in itertools.islice(self.buckets, number + 1, None):
+            yield from bucket
+
+    def first(self, count):
+        return list(itertools.islice(self, count))
+
+class WalletStore:
+    """Holds every wallet profile, indexed by address, username and owner.
+
+    search is a SortedKeys of (lowercase username or address, address) pairs, so
+    wallets matching a prefix can be found with a binary search. owner_balances holds
+    each owner's total balance and is adjusted as wallets change, never summed again.
+    ranking, and ranking_by_type for each wallet type, are SortedKeys of
+    (-balance, address) pairs, so the richest wallets come first. total_balance,
+    shared_count and type_totals are kept the same way as owner_balances.
+    """
+
+    def __init__(self, profiles=None):
+        self.fieldnames = ["address", "username", "nickname", "type", "owner", "balance", "share", "owner_id"]
+        self.load(profiles or [])
+
+    def load(self, profiles):
+        self.by_address = {}
+        self.by_username = {}
+        self.by_owner = {}
+        self.owner_balances = {}
+        self.total_balance = 0
+        self.shared_count = 0
+        self.type_totals = {} # type -> [wallet count, total balance]
+        self.removed = [] # addresses removed since the last journal write
+        # The sorted indexes are filled in one sort each below instead of one insert per wallet
+        self.search = None
+        self.ranking = None
+        self.ranking_by_type = None
         for profile in profiles:
-            if profile['share'] == "True":
-                profile['share'] = True
-            else:
-                profile['share'] = False
-                
-    if not profiles:
-        print("The database is not loaded. Exiting.")
-        exit()
+            self._index(profile)
         
-reload_db()
+        self.search = SortedKeys({(profile.address.lower(), profile.address) for profile in self.by_address.values()}
+            | {(username, profile.address) for username, profile in self.by_username.items()})
+        ranking = []
+        ranking_by_type = {}
+        for owned in self.by_owner.values():
+            for profile in owned.values():
+                ranking.append(self._rank_key(profile))
+                ranking_by_type.setdefault(profile.type, []).append(self._rank_key(profile))
+        self.ranking = SortedKeys(ranking)
+        self.ranking_by_type = {type: SortedKeys(keys) for type, keys in ranking_by_type.items()}
+
+    @staticmethod
+    def _add_key(keys, key):
+        if keys is not None:
+            keys.add(key)
+
+    @staticmethod
+    def _remove_key(keys, key):
+        if keys is not None:
+            keys.remove(key)
+
+    def _rank_key(self, profile):
+        return (-profile.balance, profile.address)
+
+    def _add_rank(self, profile):
+        self._add_key(self.ranking, self._rank_key(profile))
+        if self.ranking_by_type is not None:
+            self._add_key(self.ranking_by_type.setdefault(profile.type, SortedKeys()), self._rank_key(profile))
+
+    def _remove_rank(self, profile):
+        self._remove_key(self.ranking, self._rank_key(profile))
+        if self.ranking_by_type is not None:
+            self._remove_key(self.ranking_by_type.get(profile.type), self._rank_key(profile))
+
+    def _count(self, profile, sign):
+        """Adds a wallet to the running totals, or takes it out with a sign of -1."""
+        balance = profile.balance * sign
+        self.owner_balances[profile.owner] = self.owner_balances.get(profile.owner, 0) + balance
+        self.total_balance += balance
+        self.shared_count += sign if profile.share else 0
+        type_total = self.type_totals.setdefault(profile.type, [0, 0])
+        type_total[0] += sign
+        type_total[1] += balance
+
+    def _index(self, profile):
+        self.by_address[profile.address] = profile
+        self._add_key(self.search, (profile.address.lower(), profile.address))
+        self._index_secondary(profile)
+
+    def _index_secondary(self, profile):
+        if profile.username:
+            self.by_username[profile.username] = profile
+            self._add_key(self.search, (profile.username, profile.address))
+        self.by_owner.setdefault(profile.owner, {})[profile.address] = profile
+        self._count(profile, 1)
+        self._add_rank(profile)
+
+    def _unindex(self, profile):
+        if self.by_address.get(profile.address) is profile:
+            del self.by_address[profile.address]
+            self._remove_key(self.search, (profile.address.lower(), profile.address))
+        self._unindex_secondary(profile)
+
+    def _unindex_secondary(self, profile):
+        if self.by_username.get(profile.username) is profile:
+            del self.by_username[profile.username]
+            self._remove_key(self.search, (profile.username, profile.address))
+        owned = self.by_owner.get(profile.owner)
+        if owned is not None and owned.get(profile.address) is profile:
+            del owned[profile.address]
+            self._count(profile, -1)
+            self._remove_rank(profile)
+            if not owned:
+                del self.by_owner[profile.owner]
+                del self.owner_balances[profile.owner]
+
+    def __iter__(self):
+        return iter(list(self.by_address.values()))
+
+    def __len__(self):
+        return len(self.by_address)
+
+    def get(self, wallet):
+        """Finds a wallet by its address or username."""
+        if metrics.enabled:
+            started = time.perf_counter()
+        profile = self.by_address.get(wallet)
+        if profile is None:
+            profile = self.by_username.get(wallet)
+        if metrics.enabled:
+            metrics.observe("splatchain_wallet_lookup_seconds", time.perf_counter() - started)
+        return profile
+
+    def owned_by(self, owner):
+        return list(self.by_owner.get(owner, {}).values())
+
+    def owned_page(self, owner, start, count):
+        return list(itertools.islice(self.by_owner.get(owner, {}).values(), start, start + count))
+
+    def owner_summary(self, owner):
+        """Returns how many wallets owner has and their total balance."""
+        return len(self.by_owner.get(owner, {})), self.owner_balances.get(owner, 0)
+
+    def complete(self, prefix, owner=None, limit=25):
+        """Finds up to limit wallets whose username or address starts with prefix, listing owner's wallets first."""
+        prefix = prefix.lower()
+        results = [profile for profile in self.by_owner.get(owner, {}).values()
+            if profile.username.startswith(prefix) or profile.address.lower().startswith(prefix)][:limit]
+        seen = {profile.address for profile in results}
+        
+        for key, address in self.search.iterate_from((prefix,)):
+            if len(results) >= limit or not key.startswith(prefix):
+                break
+            if address not in seen:
+                seen.add(address)
+                results.append(self.by_address[address])
+        return results
+
+    def richest(self, count, type=None):
+        """Returns the count wallets with the highest balances, optionally only wallets of one type."""
+        ranking = self.ranking if type is None else self.ranking_by_type.get(type, SortedKeys())
+        return [self.by_address[address] for _, address in ranking.first(count)]
+
+    def rank_of(self, profile, type=None):
+        """Returns a wallet's position on the leaderboard, starting at 1, and how many wallets are ranked."""
+        ranking = self.ranking if type is None else self.ranking_by_type.get(type, SortedKeys())
+        return ranking.index(self._rank_key(profile)) + 1, len(ranking)
+
+    def recount(self):
+        """Recomputes the running totals from every wallet and prints any that drifted. Returns whether they all matched."""
+        owner_balances = {}
+        type_totals = {}
+        total_balance = shared_count = 0
+        for owned in self.by_owner.values():
+            for profile in owned.values():
+                balance = profile.balance
+                owner_balances[profile.owner] = owner_balances.get(profile.owner, 0) + balance
+                total_balance += balance
+                shared_count += 1 if profile.share else 0
+                type_total = type_totals.setdefault(profile.type, [0, 0])
+                type_total[0] += 1
+                type_total[1] += balance
+        
+        expected = {"owner_balances": owner_balances, "total_balance": total_balance, "shared_count": shared_count,
+            "type_totals": type_totals}
+        actual = {"owner_balances": self.owner_balances, "total_balance": self.total_balance, "shared_count": self.shared_count,
+            "type_totals": {type: total for type, total in self.type_totals.items() if total != [0, 0]}}
+        matched = True
+        for name in expected:
+            if expected[name] != actual[name]:
+                print(f"Running total {name} drifted: counted {expected[name]}, kept {actual[name]}")
+                matched = False
+        return matched
+
+    def add(self, profile):
+        self._index(profile)
+
+    def remove(self, profile):
+        self._unindex(profile)
+        self.removed.append(profile.address)
+
+    def discard(self, profile):
+        """Removes a wallet without recording it as a change to save."""
+        self._unindex(profile)
+
+    def set_balance(self, profile, balance):
+        if self.by_owner.get(profile.owner, {}).get(profile.address) is not profile:
+            profile.balance = balance
+            return
         
+        self._remove_rank(profile)
+        self._count(profile, -1)
+        profile.balance = balance
+        self._count(profile, 1)
+        self._add_rank(profile)
+
+    def update(self, profile, **changes):
+        """Applies changes to a wallet and keeps the indexes in sync."""
+        if changes.get('address', profile.address) != profile.address:
+            self._unindex(profile)
+            self.removed.append(profile.address)
+            profile.update(changes)
+            self._index(profile)
+        else:
+            # Address unchanged, so the wallet keeps its place in the database
+            self._unindex_secondary(profile)
+            profile.update(changes)
+            self._index_secondary(profile)
+
+wallets = WalletStore()
+
+# Loading database
+def read_db():
+    if not os.path.exists(db_file):
+        # Nothing saved yet; the first change creates the file
+        profiles = []
+    else:
+        with open(db_file, "r") as profiles_csv:
+            reader = csv.DictReader(profiles_csv)
+            profiles = list(reader)
+            for profile in profiles:
+                if profile['share'] == "True":
+                    profile['share'] = True
+                else:
+                    profile['share'] = False
+                # Databases from before owner IDs were stored don't have the column
+                if profile.get('owner_id') is None:
+                    profile['owner_id'] = ""
+            if reader.fieldnames:
+                wallets.fieldnames = list(reader.fieldnames)
+                if "owner_id" not in wallets.fieldnames:
+                    wallets.fieldnames.append("owner_id")
+    
+    if os.path.exists(journal_file):
+        profiles = replay_journal(profiles)
+    
+    return profiles
+
+def replay_journal(profiles):
+    """Applies the records in journal_file on top of the profiles read from db_file."""
+    global journal_started
+    if journal_started is None:
+        journal_started = time.monotonic()
+    
+    by_address = {profile['address']: profile for profile in profiles}
+    with open(journal_file, "r") as journal:
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a partial last line
+                print("Skipping a damaged journal record.")
+                continue
+            
+            if record['op'] == "put":
+                record['profile'].setdefault('owner_id', "")
+                by_address[record['profile']['address']] = record['profile']
+            elif record['op'] == "delete":
+                by_address.pop(record['address'], None)
+    return list(by_address.values())
+
+def load_db():
+    profiles = backend.load()
+    if not profiles:
+        print("The database is empty. Starting with no wallets.")
+    return profiles
+
 # Loading block list from internet if enabled
+block_list_enabled = os.getenv('LBS_BLOCK_LIST') == "true"
+block_servers_enabled = block_list_enabled and os.getenv('LBS_BLOCK_SERVERS') == "true"
 block_list = {}
+block_list_url = os.getenv('BLOCK_LIST_URL', "https://littlebitstudios.com/splatchain-block-list.yaml") # may also be a file:// URL
+block_list_cache_file = "./data/block-list-cache.json"
+block_list_timeout = float(os.getenv('BLOCK_LIST_TIMEOUT', 10)) # seconds
+block_list_validators = {} # ETag/Last-Modified of the last download, for conditional requests
+
+def load_cached_block_list():
+    """Loads the last block list that was fetched, so blocking works before the first fetch finishes."""
+    global block_list, block_list_validators
+    try:
+        with open(block_list_cache_file, "r") as cache:
+            cached = json.load(cache)
+    except (OSError, ValueError):
+        return
+    
+    if not isinstance(cached, dict) or not isinstance(cached.get('block_list') or {}, dict):
+        return
+    
+    block_list = cached.get('block_list') or {}
+    block_list_validators = cached.get('validators', {})
+    compile_block_list()
+    print("Block list loaded from cache.")
+
+def save_block_list_cache():
+    temp_file = block_list_cache_file + ".tmp"
+    with open(temp_file, "w") as cache:
+        json.dump({"block_list": block_list, "validators": block_list_validators}, cache)
+    os.replace(temp_file, block_list_cache_file)
+
+async def download_block_list():
+    """Returns the block list text and its validators, or None for the text if it has not changed."""
+    headers = {}
+    if 'etag' in block_list_validators:
+        headers['If-None-Match'] = block_list_validators['etag']
+    if 'last_modified' in block_list_validators:
+        headers['If-Modified-Since'] = block_list_validators['last_modified']
+    
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=block_list_timeout)) as session:
+        async with session.get(block_list_url, headers=headers) as response:
+            if response.status == 304:
+                return None, block_list_validators
+            response.raise_for_status()
+            text = await response.text()
+            validators = {}
+            if response.headers.get('ETag'):
+                validators['etag'] = response.headers['ETag']
+            if response.headers.get('Last-Modified'):
+                validators['last_modified'] = response.headers['Last-Modified']
+            return text, validators
+
+def read_block_list_file():
+    path = block_list_url[len("file://"):] if block_list_url.startswith("file://") else block_list_url
+    mtime = os.stat(path).st_mtime_ns
+    if block_list_validators.get('mtime') == mtime:
+        return None, block_list_validators
+    with open(path, "r") as list_file:
+        return list_file.read(), {"mtime": mtime}
+
+async def load_block_list():
+    global block_list, block_list_validators
+    if not block_list_enabled:
+        return
+    
+    started = time.perf_counter()
+    attempts = 3
+    for attempt in range(attempts):
+        try:
+            if block_list_url.startswith(("http://", "https://")):
+                text, validators = await download_block_list()
+            else:
+                text, validators = await asyncio.to_thread(read_block_list_file)
+            break
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            if attempt == attempts - 1:
+                print(f"Could not fetch the block list ({type(e).__name__}: {e}). Keeping the last known list.")
+                metrics.observe("splatchain_block_list_fetch_seconds", time.perf_counter() - started)
+                metrics.count("splatchain_block_list_fetches_total", outcome="failed")
+                return
+            delay = 2 ** attempt
+            print(f"Could not fetch the block list ({type(e).__name__}: {e}). Retrying in {delay} seconds.")
+            await asyncio.sleep(delay)
+    
+    metrics.observe("splatchain_block_list_fetch_seconds", time.perf_counter() - started)
+    if text is None:
+        metrics.count("splatchain_block_list_fetches_total", outcome="not_modified")
+        return
+    
+    # A broken list must not stop periodic_reload_db, which would stop database reloads too
+    try:
+        parsed = yaml.safe_load(text) or {}
+    except yaml.YAMLError as e:
+        print(f"Could not read the block list ({type(e).__name__}: {e}). Keeping the last known list.")
+        metrics.count("splatchain_block_list_fetches_total", outcome="invalid")
+        return
+    if not isinstance(parsed, dict):
+        print(f"The block list is a {type(parsed).__name__}, not a mapping. Keeping the last known list.")
+        metrics.count("splatchain_block_list_fetches_total", outcome="invalid")
+        return
+    
+    block_list = parsed
+    block_list_validators = validators
+    changed = compile_block_list()
+    metrics.count("splatchain_block_list_fetches_total", outcome=("updated" if changed else "unchanged"))
+    await asyncio.to_thread(save_block_list_cache)
+    print(f"Block list loaded: {len(block_list.get('blocked_usernames') or [])} usernames, {len(block_list.get('blocked_user_ids') or [])} user IDs, {len(block_list.get('blocked_servers') or [])} servers.")
+    
+    # New joins are checked in on_guild_join, so existing servers only need checking again when the list changes
+    if changed and block_servers_enabled and bot.is_ready():
+        await server_block_sweep()
 
-def load_block_list():
-    global block_list
-    if os.getenv('LBS_BLOCK_LIST') == "true":
-        print("Loading block list.")
-        listreq = requests.get("https://littlebitstudios.com/splatchain-block-list.yaml")
-        block_list = yaml.safe_load(listreq.text)
-        print(f"Block list loaded: {block_list}")
+class CompiledBlockList(NamedTuple):
+    usernames: frozenset = frozenset()
+    user_ids: frozenset = frozenset()
+    servers: frozenset = frozenset()
 
-load_block_list()
+compiled_block_list = CompiledBlockList()
+
+def compile_block_list():
+    """Turns the raw block list into frozensets so each check is a hash lookup. Returns whether anything changed."""
+    global compiled_block_list
+    previous = compiled_block_list
+    compiled_block_list = CompiledBlockList(
+        usernames=frozenset(block_list.get('blocked_usernames') or []),
+        user_ids=frozenset(block_list.get('blocked_user_ids') or []),
+        servers=frozenset(block_list.get('blocked_servers') or [])
+    )
+    return compiled_block_list != previous
 
 def user_block_check(user: discord.User) -> bool:
-    global block_list
-    if os.getenv('LBS_BLOCK_LIST') == "true":
-        print(f"Checking block list for user: {user.name} (ID: {user.id})")
-        if user.name in block_list.get('blocked_usernames', []):
-            return True
-        if user.id in block_list.get('blocked_user_ids', []):
-            return True
+    if block_list_enabled:
+        return user.name in compiled_block_list.usernames or user.id in compiled_block_list.user_ids
     return False
 
+banned_embed = discord.Embed(
+    title="BANNED",
+    description="You violated the SplatChain Bot Terms and are banned from using the bot.",
+    color=discord.colour.Color.red()
+)
+banned_embed.set_footer(text="If you wish to appeal, DM littlebit670.")
+
 # Detecting duplicates
 def detect_duplicates(profiles):
+    """Returns profiles with any repeated address or username dropped, keeping the first one seen."""
     seen_addresses = set()
     seen_usernames = set()
+    unique_profiles = []
     for profile in profiles:
         if profile['address'] in seen_addresses:
             print(f"Duplicate address found: {profile['address']}. Removing duplicate.")
-            profiles.remove(profile)
-        else:
-            seen_addresses.add(profile['address'])
+            continue
         
         if profile['username'] in seen_usernames and profile['username']:
             print(f"Duplicate username found: {profile['username']}. Removing duplicate.")
-            profiles.remove(profile)
-        else:
-            seen_usernames.add(profile['username'])
+            continue
+        
+        seen_addresses.add(profile['address'])
+        seen_usernames.add(profile['username'])
+        unique_profiles.append(profile)
+    return unique_profiles
             
-def is_duplicate(profile):
-    for other_profile in profiles:
-        if profile != other_profile and profile['address'] == other_profile['address']:
-            return True
-        if profile != other_profile and profile['username'] == other_profile['username']:
-            return True
+def is_duplicate(profile, original=None):
+    # original is the stored wallet that profile is an edited copy of
+    original = original or profile
+    other_profile = wallets.by_address.get(profile.address)
+    if other_profile is not None and other_profile is not original:
+        return True
+    other_profile = wallets.by_username.get(profile.username)
+    if other_profile is not None and other_profile is not original:
+        return True
     return False
 
+def generate_address(taken_addresses):
+    while True:
+        # 20 random bytes are 40 hex digits, drawn in one call instead of one per digit
+        address = secrets.token_hex(20)
+        if address not in taken_addresses:
+            return address
+
 # Validating profiles
-print("Validating profiles in database")
+username_pattern = re.compile(r"^[a-z0-9.]+$")
+address_pattern = re.compile(r"[0-9a-fA-F]{40}")
 
-def profile_validator(profile):
-    detect_duplicates(profiles)
-    
+def profile_validator(profile, taken_addresses):
     if 'username' in profile and profile['username']:
-        if not profile["username"].endswith(".ink") or not re.match(r"^[a-z0-9.]+$", profile["username"]):
+        if not profile["username"].endswith(".ink") or not username_pattern.match(profile["username"]):
             print(f"Address {profile['address']} has an invalid username of {profile['username']}.")
             print("Usernames must end in .ink and contain only lowercase letters, numbers, and periods!")
             profile["username"] = ""
         
-    if re.match(r"[0-9a-fA-F]{40}", profile['address']) is None:
+    if profile.get('owner_id') and not profile['owner_id'].isdigit():
+        print(f"Address {profile['address']} has an invalid owner ID of {profile['owner_id']}. Clearing it.")
+        profile['owner_id'] = ""
+        
+    if address_pattern.match(profile['address']) is None:
         print(f"Address {profile['address']} has an invalid address. Regenerating address.")
-        valid_chars = "0123456789abcdefABCDEF"
-        profile['address'] = "".join(secrets.choice(valid_chars) for _ in range(40))
+        profile['address'] = generate_address(taken_addresses)
         
     if "," in profile['balance']:
         print(f"Address {profile['address']} has commas in the balance, removing the commas")
@@ -119,46 +796,1374 @@ def profile_validator(profile):
         else:
             print(f"Profile types can only be a 'Person' or a 'Business'. Setting type to 'Person' by default.")
             profile['type'] = "Person"
-            
-for profile in profiles:
-    profile_validator(profile)
 
-# Database functions
-def write_changes():
+def validate_db(profiles):
+    """Runs the full validation pass over a freshly read database."""
+    print("Validating profiles in database")
+    taken_addresses = {profile['address'] for profile in profiles}
     for profile in profiles:
-        profile_validator(profile)
-    
-    with open(db_file, "w", newline='') as profiles_csv:
-        writer = csv.DictWriter(profiles_csv, fieldnames=profiles[0].keys())
+        profile_validator(profile, taken_addresses)
+        taken_addresses.add(profile['address'])
+    return detect_duplicates(profiles)
+
+def validated_wallets(profiles):
+    """Builds wallets from what backend.load() returned, validating them on the way.
+
+    SQLite hands back wallets built from typed rows, which were validated before they were stored,
+    so they are only validated again to repair the database.
+    """
+    if isinstance(backend, SQLiteBackend):
+        if os.getenv('REPAIR_DB') != "true":
+            return profiles
+        profiles = [profile.to_row() for profile in profiles]
+    return [Wallet.from_row(row) for row in validate_db(profiles)]
+
+# Database functions
+def write_snapshot(profiles):
+    """Rewrites db_file with profiles and returns how many bytes were written."""
+    # Written to a temporary file first so a crash never leaves a half-written database
+    temp_file = db_file + ".tmp"
+    with open(temp_file, "w", newline='') as profiles_csv:
+        writer = csv.DictWriter(profiles_csv, fieldnames=wallets.fieldnames)
         writer.writeheader()
         writer.writerows(profiles)
+    written = os.path.getsize(temp_file)
+    os.replace(temp_file, db_file)
+    return written
+
+def append_journal(changed_profiles, removed_addresses):
+    global journal_started
+    records = [{"op": "delete", "address": address} for address in removed_addresses]
+    records += [{"op": "put", "profile": profile} for profile in changed_profiles]
+    if not records:
+        return 0
+    
+    data = "".join(json.dumps(record) + "\n" for record in records)
+    with open(journal_file, "a") as journal:
+        journal.write(data)
+    
+    if journal_started is None:
+        journal_started = time.monotonic()
+    return len(data.encode())
+
+# Storage backends
+class CSVBackend:
+    """Stores wallets in db_file, either rewritten on every change or with an append-only journal."""
+
+    def __init__(self):
+        # What db_file and journal_file looked like when last read or written
+        self.file_stats = None
+        self.file_hash = None
+
+    def _stat_files(self):
+        stats = []
+        for path in (db_file, journal_file):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                stats.append((stat.st_mtime_ns, stat.st_size))
+            else:
+                stats.append(None)
+        return stats
+
+    def _hash_files(self):
+        digest = hashlib.sha256()
+        for path in (db_file, journal_file):
+            if os.path.exists(path):
+                with open(path, "rb") as db:
+                    for chunk in iter(lambda: db.read(1048576), b""):
+                        digest.update(chunk)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def load(self):
+        self.file_stats = self._stat_files()
+        self.file_hash = self._hash_files()
+        return read_db()
+
+    def changed(self):
+        """Checks whether something other than this bot changed the database files since they were last read."""
+        file_stats = self._stat_files()
+        if file_stats == self.file_stats:
+            return False
+        
+        # Touched but not edited files keep their hash
+        self.file_stats = file_stats
+        file_hash = self._hash_files()
+        if file_hash == self.file_hash:
+            return False
+        return True
+
+    @property
+    def full_rewrite(self):
+        return not journal_enabled
+
+    def save(self, changed_profiles, removed_addresses, profiles=None):
+        """Saves changes and returns how many bytes were written."""
+        if journal_enabled:
+            written = append_journal(changed_profiles, removed_addresses)
+            self.file_stats = self._stat_files()
+            return written
+        else:
+            return self.replace_all(profiles)
+
+    def replace_all(self, profiles):
+        written = write_snapshot(profiles)
+        if os.path.exists(journal_file):
+            os.remove(journal_file)
+        self.file_stats = self._stat_files()
+        return written
+
+    def add_all(self, profiles):
+        """Adds profiles after the stored ones, streaming both into a new db_file."""
+        return self.replace_all(itertools.chain(self.iter_rows(), profiles))
+
+    def iter_rows(self):
+        """Yields the stored profiles one at a time, like read_db but without holding them all."""
+        # The journal is small next to db_file, so it's read up front; None marks a deleted wallet
+        journaled = {}
+        if os.path.exists(journal_file):
+            with open(journal_file, "r") as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record['op'] == "put":
+                        record['profile'].setdefault('owner_id', "")
+                        journaled[record['profile']['address']] = record['profile']
+                    elif record['op'] == "delete":
+                        journaled[record['address']] = None
+        
+        if os.path.exists(db_file):
+            with open(db_file, "r") as profiles_csv:
+                reader = csv.DictReader(profiles_csv)
+                if reader.fieldnames:
+                    wallets.fieldnames = list(reader.fieldnames)
+                    if "owner_id" not in wallets.fieldnames:
+                        wallets.fieldnames.append("owner_id")
+                for profile in reader:
+                    if profile['address'] in journaled:
+                        profile = journaled.pop(profile['address'])
+                        if profile is None:
+                            continue
+                    else:
+                        profile['share'] = profile['share'] == "True"
+                        if profile.get('owner_id') is None:
+                            profile['owner_id'] = ""
+                    yield profile
+        
+        for profile in journaled.values():
+            if profile is not None:
+                yield profile
+
+class SQLiteBackend:
+    """Stores wallets in a SQLite database in WAL mode, writing only the rows that changed.
+
+    When shared, several bot processes use the same database. Every save also adds the
+    changed addresses to the changes table, so the other processes can reload just those
+    wallets. Balances belong to the database in that case: they are changed in place by
+    update_balances and set_balance, and save never writes over them.
+    """
+
+    columns = ["address", "username", "nickname", "type", "owner", "balance", "share", "owner_id"]
+    full_rewrite = False
+    changes_kept = 100000 # rows kept in the changes table; a process further behind than this reloads everything
+
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        # Writes come from db_executor and reloads from the event loop, so the lock keeps them apart
+        self.lock = threading.Lock()
+        # Other processes can hold the write lock for a moment, so wait for them instead of failing
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30 if shared else 5)
+        self.data_version = None
+        self.change_seq = 0 # last row of the changes table this process has seen
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS wallets (
+                    address TEXT PRIMARY KEY,
+                    username TEXT NOT NULL DEFAULT '',
+                    nickname TEXT NOT NULL DEFAULT '',
+                    type TEXT NOT NULL DEFAULT 'Person',
+                    owner TEXT NOT NULL DEFAULT '',
+                    balance INTEGER NOT NULL DEFAULT 0,
+                    share INTEGER NOT NULL DEFAULT 0,
+                    owner_id TEXT NOT NULL DEFAULT ''
+                )
+            """)
+            # Databases from before owner IDs were stored don't have the column
+            table_columns = [row[1] for row in self.connection.execute("PRAGMA table_info(wallets)")]
+            if "owner_id" not in table_columns:
+                self.connection.execute("ALTER TABLE wallets ADD COLUMN owner_id TEXT NOT NULL DEFAULT ''")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS wallets_username ON wallets (username)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS wallets_owner ON wallets (owner)")
+            if shared:
+                # An empty address means every wallet changed
+                self.connection.execute("CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, address TEXT NOT NULL)")
+                self.connection.execute("CREATE TABLE IF NOT EXISTS ledger (id INTEGER PRIMARY KEY AUTOINCREMENT, address TEXT NOT NULL, entry TEXT NOT NULL)")
+                self.connection.execute("CREATE INDEX IF NOT EXISTS ledger_address ON ledger (address, id)")
+                # Processes only see each other's wallets after a moment, so the database has to keep usernames unique
+                duplicates = self.connection.execute(
+                    "SELECT rowid, address, username FROM wallets WHERE username != '' AND rowid NOT IN (SELECT MIN(rowid) FROM wallets WHERE username != '' GROUP BY username)"
+                ).fetchall()
+                for rowid, address, username in duplicates:
+                    print(f"Duplicate username found: {username}. Clearing it from {address} so both wallets are kept.")
+                    self.connection.execute("UPDATE wallets SET username = '' WHERE rowid = ?", (rowid,))
+                self.connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS wallets_username_unique ON wallets (username) WHERE username != ''")
+
+    def _row(self, profile):
+        return (profile['address'], profile['username'], profile['nickname'], profile['type'], profile['owner'], int(profile['balance']), int(profile['share']), profile.get('owner_id', ""))
+
+    def load(self):
+        # user_version records that db_file was imported, so emptying the database later doesn't bring the old wallets back
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] < 1:
+            if self.connection.execute("SELECT 1 FROM wallets LIMIT 1").fetchone() is None and os.path.exists(db_file):
+                self.import_csv()
+            with self.lock, self.connection:
+                self.connection.execute("PRAGMA user_version = 1")
+        
+        with self.lock, self.connection:
+            # One read transaction, so the wallets and the position in the changes table match
+            self.connection.execute("BEGIN")
+            rows = self.connection.execute(f"SELECT {', '.join(self.columns)} FROM wallets ORDER BY rowid").fetchall()
+            self.data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+            if self.shared:
+                self.change_seq = self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        return [Wallet.from_db(row) for row in rows]
+
+    def changed(self):
+        """Checks whether another connection committed to the database since it was last read."""
+        # data_version only moves for commits made by other connections, never our own
+        with self.lock:
+            return self.connection.execute("PRAGMA data_version").fetchone()[0] != self.data_version
+
+    def save(self, changed_profiles, removed_addresses, profiles=None):
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM wallets WHERE address = ?", [(address,) for address in removed_addresses])
+            for profile in changed_profiles:
+                # Balance changes are by far the most common, so try a single-row UPDATE first
+                if self.shared:
+                    # New wallets and usernames are written straight away by insert_wallet and rename_wallet
+                    self.connection.execute(
+                        "UPDATE wallets SET nickname = ?, type = ?, owner = ?, share = ?, owner_id = ? WHERE address = ?",
+                        self._row(profile)[2:5] + self._row(profile)[6:] + (profile['address'],)
+                    )
+                    continue
+                else:
+                    cursor = self.connection.execute(
+                        "UPDATE wallets SET username = ?, nickname = ?, type = ?, owner = ?, balance = ?, share = ?, owner_id = ? WHERE address = ?",
+                        self._row(profile)[1:] + (profile['address'],)
+                    )
+                if cursor.rowcount == 0:
+                    self.connection.execute(f"INSERT INTO wallets ({', '.join(self.columns)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._row(profile))
+            if self.shared:
+                self._record_changes(list(removed_addresses) + [profile['address'] for profile in changed_profiles])
+
+    def replace_all(self, profiles):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM wallets")
+            self.connection.executemany(f"INSERT INTO wallets ({', '.join(self.columns)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (self._row(profile) for profile in profiles))
+            if self.shared:
+                self._record_changes([""])
+
+    def add_all(self, profiles):
+        """Inserts profiles in one transaction, so either all of them are added or none are."""
+        with self.lock, self.connection:
+            self.connection.executemany(f"INSERT INTO wallets ({', '.join(self.columns)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (self._row(profile) for profile in profiles))
+            if self.shared:
+                self._record_changes([""])
+
+    def _record_changes(self, addresses):
+        cursor = self.connection.executemany("INSERT INTO changes (address) VALUES (?)", [(address,) for address in addresses])
+        seq = self.connection.execute("SELECT last_insert_rowid()").fetchone()[0]
+        if cursor.rowcount and seq % 1000 < cursor.rowcount:
+            # Trimmed now and then rather than on every write
+            self.connection.execute("DELETE FROM changes WHERE seq <= ?", (seq - self.changes_kept,))
+
+    def update_balances(self, changes, debits):
+        """Adds each address's amount in changes to its stored balance, all or nothing.
+
+        The write lock is taken before the balances are read, so a transaction in another process
+        can't spend the same SPLC in between. debits holds the amount each debited wallet must have.
+        Returns ("ok", new balances by address), ("missing", address) or ("insufficient", address, balance).
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                balances = {}
+                for address in changes:
+                    row = self.connection.execute("SELECT balance FROM wallets WHERE address = ?", (address,)).fetchone()
+                    if row is None:
+                        self.connection.rollback()
+                        return ("missing", address)
+                    balances[address] = row[0]
+                
+                for address, amount in debits.items():
+                    if balances[address] < amount:
+                        self.connection.rollback()
+                        return ("insufficient", address, balances[address])
+                
+                for address, amount in changes.items():
+                    balances[address] += amount
+                self.connection.executemany("UPDATE wallets SET balance = ? WHERE address = ?", [(balance, address) for address, balance in balances.items()])
+                self._record_changes(list(balances))
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+        return ("ok", balances)
+
+    def insert_wallet(self, profile):
+        """Adds a new wallet straight away, returning False if its address or username is already stored."""
+        with self.lock:
+            try:
+                with self.connection:
+                    self.connection.execute(f"INSERT INTO wallets ({', '.join(self.columns)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._row(profile))
+                    self._record_changes([profile['address']])
+            except sqlite3.IntegrityError:
+                return False
+        return True
+
+    def rename_wallet(self, address, username):
+        """Changes a wallet's username straight away, returning False if another wallet already has it."""
+        with self.lock:
+            try:
+                with self.connection:
+                    self.connection.execute("UPDATE wallets SET username = ? WHERE address = ?", (username, address))
+                    self._record_changes([address])
+            except sqlite3.IntegrityError:
+                return False
+        return True
+
+    def set_balance(self, address, balance):
+        """Sets a stored balance and returns the one it replaced, or None if the wallet no longer exists."""
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute("SELECT balance FROM wallets WHERE address = ?", (address,)).fetchone()
+                if row is None:
+                    self.connection.rollback()
+                    return None
+                self.connection.execute("UPDATE wallets SET balance = ? WHERE address = ?", (balance, address))
+                self._record_changes([address])
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+        return row[0]
+
+    def changes_since(self):
+        """Returns the rows of wallets changed since the last call, with None for deleted ones.
+
+        Returns None when the changes needed were already trimmed or every wallet changed,
+        in which case everything has to be reloaded.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("BEGIN")
+            data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self.data_version:
+                return {}
+            
+            oldest = self.connection.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            changes = self.connection.execute("SELECT seq, address FROM changes WHERE seq > ? ORDER BY seq", (self.change_seq,)).fetchall()
+            if oldest is not None and oldest > self.change_seq + 1 or any(address == "" for _, address in changes):
+                return None
+            
+            addresses = {address for _, address in changes}
+            rows = dict.fromkeys(addresses)
+            addresses = list(addresses)
+            # Looked up in chunks to stay under SQLite's limit on query parameters
+            for start in range(0, len(addresses), 500):
+                chunk = addresses[start:start + 500]
+                for row in self.connection.execute(f"SELECT {', '.join(self.columns)} FROM wallets WHERE address IN ({', '.join('?' * len(chunk))})", chunk):
+                    profile = dict(zip(self.columns, row))
+                    profile['balance'] = str(profile['balance'])
+                    profile['share'] = bool(profile['share'])
+                    rows[profile['address']] = profile
+            
+            self.data_version = data_version
+            if changes:
+                self.change_seq = changes[-1][0]
+            return rows
+
+    def iter_rows(self):
+        """Yields the stored profiles one at a time, in the order load() returns them."""
+        cursor = self.connection.execute(f"SELECT {', '.join(self.columns)} FROM wallets ORDER BY rowid")
+        for row in cursor:
+            profile = dict(zip(self.columns, row))
+            profile['balance'] = str(profile['balance'])
+            profile['share'] = bool(profile['share'])
+            yield profile
+
+    def import_csv(self):
+        """One-shot import of db_file (and its journal) into an empty database."""
+        print(f"Importing {db_file} into {self.path}.")
+        profiles = validate_db(read_db())
+        self.replace_all(profiles)
+        print(f"Imported {len(profiles)} wallets.")
+
+backend = None # opened by open_backend() at startup
+
+def open_backend():
+    global backend, ledger
+    os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    if shared_db:
+        # Processes can only share wallets through SQLite
+        backend = SQLiteBackend(sqlite_file, shared=True)
+        ledger = SQLiteLedger(backend)
+        if os.path.isdir(ledger_dir):
+            ledger.import_files(ledger_dir)
+    elif os.getenv('DB_BACKEND') == "sqlite":
+        backend = SQLiteBackend(sqlite_file)
+    else:
+        backend = CSVBackend()
+
+class ChangeWriter:
+    """Collects wallet changes from commands and writes them to the backend off the event loop.
+
+    Changes arriving within write_debounce seconds of each other are written together,
+    but never more than write_max_delay seconds after the first one.
+    """
+
+    def __init__(self):
+        self.pending_profiles = {} # id(profile) -> profile
+        self.pending_removed = set()
+        self.in_flight = set() # addresses taken for the save that is running, until it has been written
+        self.last_change = 0
+        self.changes_waiting = None
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.changes_waiting = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+
+    def add(self, changed_profiles, removed_addresses):
+        for profile in changed_profiles:
+            self.pending_profiles[id(profile)] = profile
+        self.pending_removed.update(removed_addresses)
+        self.last_change = time.monotonic()
+        
+        if self.task is None:
+            # Not running on the bot's event loop yet, so write straight away
+            self.flush_now()
+        else:
+            self.changes_waiting.set()
+
+    async def run(self):
+        while True:
+            await self.changes_waiting.wait()
+            first_change = time.monotonic()
+            # Plain sleeps rather than wait_for, which can swallow a cancellation and hang shutdown
+            while True:
+                delay = min(self.last_change + write_debounce, first_change + write_max_delay) - time.monotonic()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.changes_waiting.clear()
+            async with profiler.trace_memory("save"):
+                await self.flush()
+
+    def _take_pending(self):
+        # Only wallets still in the store are saved, and only addresses no longer in it are deleted
+        originals = [profile for profile in self.pending_profiles.values() if wallets.by_address.get(profile.address) is profile]
+        removed_addresses = [address for address in self.pending_removed if address not in wallets.by_address]
+        self.pending_profiles = {}
+        self.pending_removed = set()
+        
+        # Rows for storage, so commands can keep changing wallets while the write runs in another thread
+        changed_profiles = [profile.to_row() for profile in originals]
+        # A full rewrite only copies the list here, since building every row would hold up the event loop
+        profiles = list(wallets) if backend.full_rewrite else None
+        return originals, changed_profiles, removed_addresses, profiles
+
+    @staticmethod
+    def _save(changed_profiles, removed_addresses, profiles):
+        # Commands may change wallets while their rows are built here, but every such change
+        # is pending again by then, so the next save writes it.
+        if profiles is not None:
+            profiles = (profile.to_row() for profile in profiles)
+        return backend.save(changed_profiles, removed_addresses, profiles)
+
+    async def flush(self):
+        if not self.pending_profiles and not self.pending_removed:
+            return
+        
+        originals, changed_profiles, removed_addresses, profiles = self._take_pending()
+        self.in_flight = {profile.address for profile in originals} | set(removed_addresses)
+        started = time.perf_counter()
+        try:
+            written = await asyncio.get_running_loop().run_in_executor(db_executor, self._save, changed_profiles, removed_addresses, profiles)
+        except Exception as e:
+            self.in_flight = set()
+            print(f"Could not save changes, retrying with the next write: {e}")
+            metrics.count("splatchain_flush_errors_total")
+            for profile in originals:
+                self.pending_profiles.setdefault(id(profile), profile)
+            self.pending_removed.update(removed_addresses)
+            return
+        
+        self.in_flight = set()
+        metrics.observe("splatchain_flush_seconds", time.perf_counter() - started)
+        if written is not None:
+            # The SQLite backend doesn't report bytes
+            metrics.count("splatchain_flush_bytes_total", written)
+
+    def pending_addresses(self):
+        """Addresses whose in-memory version hasn't been written yet, including those in the save that is running."""
+        return {profile.address for profile in self.pending_profiles.values()} | self.pending_removed | self.in_flight
+
+    def flush_now(self):
+        if not self.pending_profiles and not self.pending_removed:
+            return
+        
+        originals, changed_profiles, removed_addresses, profiles = self._take_pending()
+        self._save(changed_profiles, removed_addresses, profiles)
+
+change_writer = ChangeWriter()
+
+def write_changes(*changed_profiles):
+    started = time.perf_counter()
+    # Only the wallets a command touched need validating; uniqueness is
+    # already enforced through the store's indexes.
+    for profile in changed_profiles:
+        row = profile.to_row()
+        profile_validator(row, wallets.by_address)
+        if row != profile.to_row():
+            wallets.update(profile, **Wallet.from_row(row).fields())
+    
+    change_writer.add(changed_profiles, wallets.removed)
+    wallets.removed.clear()
+    metrics.observe("splatchain_write_changes_seconds", time.perf_counter() - started)
+
+async def add_wallet(profile):
+    """Adds a new wallet to the store and saves it, returning False if it turned out to be a duplicate."""
+    if shared_db:
+        # Validated like write_changes would, since the row goes straight into the database
+        row = profile.to_row()
+        profile_validator(row, wallets.by_address)
+        if row != profile.to_row():
+            profile.update(Wallet.from_row(row).fields())
+        
+        # Written before the command responds, so other processes' balance changes can find it in the database
+        if not await asyncio.get_running_loop().run_in_executor(db_executor, backend.insert_wallet, row):
+            return False
+        if is_duplicate(profile):
+            # A wallet renamed away from this username in another process is still cached; sync_shared_db adds this one once it catches up
+            return True
+        wallets.add(profile)
+        return True
+    
+    wallets.add(profile)
+    write_changes(profile)
+    return True
+
+# Transaction history
+ledger_dir = "./data/ledger"
+ledger_max_bytes = int(os.getenv('LEDGER_MAX_BYTES', 10485760)) # start a new ledger file past this size
+ledger_retention = int(os.getenv('LEDGER_RETENTION', 0)) # ledger files to keep, 0 keeps all of them
+
+class Ledger:
+    """Append-only record of every balance change, split across numbered files.
+
+    An index of where each wallet's entries sit in the files is built once, so reading
+    a wallet's latest entries costs one seek per entry. Everything that touches the files
+    runs in db_executor.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = {} # address -> [(file number, byte offset)], oldest first
+        self.files = [] # file numbers on disk, oldest first
+        self.loaded = False
+
+    def _path(self, number):
+        return os.path.join(self.directory, f"ledger-{number:05d}.jsonl")
+
+    def load_index(self):
+        if self.loaded:
+            return
+        
+        os.makedirs(self.directory, exist_ok=True)
+        self.files = sorted(int(name[7:12]) for name in os.listdir(self.directory) if re.fullmatch(r"ledger-\d{5}\.jsonl", name)) or [1]
+        for number in self.files:
+            if not os.path.exists(self._path(number)):
+                continue
+            with open(self._path(number), "rb") as ledger_file:
+                offset = 0
+                for line in ledger_file:
+                    try:
+                        address = json.loads(line)['address']
+                    except (ValueError, KeyError):
+                        address = None # a partial line from a crash
+                    if address is not None:
+                        self.index.setdefault(address, []).append((number, offset))
+                    offset += len(line)
+        self.loaded = True
+
+    def record(self, entries):
+        future = db_executor.submit(self._append, entries)
+        future.add_done_callback(lambda future: future.exception() and print(f"Could not write to the ledger: {future.exception()}"))
+
+    def _append(self, entries):
+        self.load_index()
+        number = self.files[-1]
+        with open(self._path(number), "ab") as ledger_file:
+            offset = ledger_file.tell()
+            for entry in entries:
+                line = (json.dumps(entry) + "\n").encode()
+                ledger_file.write(line)
+                self.index.setdefault(entry['address'], []).append((number, offset))
+                offset += len(line)
+        
+        if offset >= ledger_max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self.files.append(self.files[-1] + 1)
+        if not ledger_retention or len(self.files) <= ledger_retention:
+            return
+        
+        dropped = self.files[:-ledger_retention]
+        self.files = self.files[-ledger_retention:]
+        for number in dropped:
+            if os.path.exists(self._path(number)):
+                os.remove(self._path(number))
+        
+        oldest = self.files[0]
+        for address, positions in list(self.index.items()):
+            kept = [position for position in positions if position[0] >= oldest]
+            if kept:
+                self.index[address] = kept
+            else:
+                del self.index[address]
+
+    def read(self, address, skip, count):
+        """Returns up to count entries for a wallet, newest first, after skipping the newest skip entries, and the wallet's total entry count."""
+        self.load_index()
+        positions = self.index.get(address, [])
+        end = max(len(positions) - skip, 0)
+        entries = []
+        open_files = {}
+        try:
+            for number, offset in reversed(positions[max(end - count, 0):end]):
+                if number not in open_files:
+                    open_files[number] = open(self._path(number), "rb")
+                open_files[number].seek(offset)
+                entries.append(json.loads(open_files[number].readline()))
+        finally:
+            for ledger_file in open_files.values():
+                ledger_file.close()
+        return entries, len(positions)
+
+class SQLiteLedger:
+    """The ledger for a shared database, kept in its ledger table so /history sees entries from every process."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def import_files(self, directory):
+        """Copies a file ledger into an empty ledger table, so history from before sharded mode is kept."""
+        file_ledger = Ledger(directory)
+        file_ledger.load_index()
+        connection = self.backend.connection
+        with self.backend.lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have got here first
+                if connection.execute("SELECT 1 FROM ledger LIMIT 1").fetchone() is None:
+                    for number in file_ledger.files:
+                        if not os.path.exists(file_ledger._path(number)):
+                            continue
+                        with open(file_ledger._path(number), "r") as ledger_file:
+                            for line in ledger_file:
+                                try:
+                                    entry = json.loads(line)
+                                except ValueError:
+                                    continue # a partial line from a crash
+                                connection.execute("INSERT INTO ledger (address, entry) VALUES (?, ?)", (entry['address'], line.strip()))
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+
+    def record(self, entries):
+        future = db_executor.submit(self._append, entries)
+        future.add_done_callback(lambda future: future.exception() and print(f"Could not write to the ledger: {future.exception()}"))
+
+    def _append(self, entries):
+        with self.backend.lock, self.backend.connection:
+            self.backend.connection.executemany("INSERT INTO ledger (address, entry) VALUES (?, ?)", [(entry['address'], json.dumps(entry)) for entry in entries])
+
+    def read(self, address, skip, count):
+        with self.backend.lock:
+            total = self.backend.connection.execute("SELECT COUNT(*) FROM ledger WHERE address = ?", (address,)).fetchone()[0]
+            rows = self.backend.connection.execute("SELECT entry FROM ledger WHERE address = ? ORDER BY id DESC LIMIT ? OFFSET ?", (address, count, skip)).fetchall()
+        return [json.loads(entry) for entry, in rows], total
+
+ledger = Ledger(ledger_dir) # replaced with a SQLiteLedger by open_backend() in sharded mode
+
+def ledger_entry(profile, event, change, actor="", note=""):
+    return {
+        "time": int(time.time()),
+        "address": profile.address,
+        "event": event,
+        "change": change,
+        "balance": profile.balance,
+        "actor": actor,
+        "note": note
+    }
+
+# Transactions
+class TransactionError(Exception):
+    pass
+
+class WalletNotFound(TransactionError):
+    def __init__(self, profile):
+        super().__init__(f"{profile.address} no longer exists")
+        self.profile = profile
+
+class InsufficientBalance(TransactionError):
+    def __init__(self, profile, balance, amount):
+        super().__init__(f"{profile.address} holds {balance} SPLC, {amount} SPLC requested")
+        self.profile = profile
+        self.balance = balance
+        self.amount = amount
+
+class TransactionEngine:
+    """Applies balance changes to one or more wallets as a single step.
+
+    Each wallet has its own lock, so transactions on unrelated wallets never wait on each other.
+    Locks are always taken in address order, so two transactions sharing wallets can't deadlock.
+    """
+
+    def __init__(self):
+        self.locks = weakref.WeakValueDictionary() # address -> asyncio.Lock, dropped once unused
+        self.injected = 0 # SPLC injected since startup
+        self.burned = 0 # SPLC burned since startup
+
+    def _lock(self, address):
+        lock = self.locks.get(address)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.locks[address] = lock
+        return lock
+
+    @contextlib.asynccontextmanager
+    async def locked(self, *profiles):
+        locks = [self._lock(address) for address in sorted({profile.address for profile in profiles})]
+        acquired = []
+        try:
+            for lock in locks:
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    async def apply(self, changes, event="", actor="", notes=None):
+        """Applies (profile, amount) pairs, where a negative amount is a debit, all or nothing.
+
+        Each wallet's net change is recorded in the ledger under event, with the note for its address from notes.
+        """
+        async with self.locked(*(profile for profile, _ in changes)):
+            debits = {}
+            credits = {}
+            profiles = {}
+            for profile, amount in changes:
+                if wallets.by_address.get(profile.address) is not profile:
+                    raise WalletNotFound(profile)
+                profiles[profile.address] = profile
+                if amount < 0:
+                    debits[profile.address] = debits.get(profile.address, 0) - amount
+                else:
+                    credits[profile.address] = credits.get(profile.address, 0) + amount
+            
+            if shared_db:
+                # Other processes change balances too, so the check and the change both happen in the database
+                net = {address: credits.get(address, 0) - debits.get(address, 0) for address in profiles}
+                result = await asyncio.get_running_loop().run_in_executor(db_executor, backend.update_balances, net, debits)
+                if result[0] == "missing":
+                    raise WalletNotFound(profiles[result[1]])
+                if result[0] == "insufficient":
+                    raise InsufficientBalance(profiles[result[1]], result[2], debits[result[1]])
+                for address, balance in result[1].items():
+                    wallets.set_balance(profiles[address], balance)
+            else:
+                # Check every debit before touching any balance
+                for address, amount in debits.items():
+                    balance = profiles[address].balance
+                    if balance < amount:
+                        raise InsufficientBalance(profiles[address], balance, amount)
+                
+                for address, profile in profiles.items():
+                    wallets.set_balance(profile, profile.balance - debits.get(address, 0) + credits.get(address, 0))
+                write_changes(*profiles.values())
+            
+            notes = notes or {}
+            ledger.record([ledger_entry(profile, event, credits.get(address, 0) - debits.get(address, 0), actor, notes.get(address, "")) for address, profile in profiles.items()])
+
+    async def set_balance(self, profile, balance):
+        """Sets a wallet's balance and returns the balance it replaced. The caller must hold the wallet's lock."""
+        if not shared_db:
+            previous = profile.balance
+            wallets.set_balance(profile, balance)
+            write_changes(profile)
+            return previous
+        
+        # Nothing validates the balance on the way into the database here, so match what profile_validator does
+        balance = max(balance, 0)
+        previous = await asyncio.get_running_loop().run_in_executor(db_executor, backend.set_balance, profile.address, balance)
+        if previous is None:
+            raise WalletNotFound(profile)
+        wallets.set_balance(profile, balance)
+        return previous
+
+    async def transfer(self, from_profile, to_profile, amount, actor=""):
+        await self.apply([(from_profile, -amount), (to_profile, amount)], "transfer", actor, {
+            from_profile.address: f"to {to_profile.username}",
+            to_profile.address: f"from {from_profile.username}"
+        })
+
+    async def payout(self, from_profile, payments, actor=""):
+        """Pays (profile, amount) pairs from one wallet, all or nothing."""
+        total = sum(amount for _, amount in payments)
+        notes = {to_profile.address: f"from {from_profile.username}" for to_profile, _ in payments}
+        notes[from_profile.address] = f"to {len(payments)} wallets"
+        await self.apply([(from_profile, -total)] + [(to_profile, amount) for to_profile, amount in payments], "payout", actor, notes)
+
+    async def inject(self, profile, amount, actor=""):
+        await self.apply([(profile, amount)], "inject", actor)
+        self.injected += amount
+
+    async def burn(self, profile, amount, actor=""):
+        await self.apply([(profile, -amount)], "burn", actor)
+        self.burned += amount
+
+transactions = TransactionEngine()
+
+# Reloading database
+def apply_db_changes(profiles):
+    """Brings the store in line with a freshly read database, touching only the wallets that differ."""
+    added = updated = removed = 0
+    # Wallets with changes not yet saved keep their in-memory version
+    pending = change_writer.pending_addresses()
+    
+    seen_addresses = set()
+    for profile in profiles:
+        seen_addresses.add(profile.address)
+        if profile.address in pending:
+            continue
+        
+        existing = wallets.by_address.get(profile.address)
+        if existing is None:
+            if not is_duplicate(profile):
+                wallets.add(profile)
+                added += 1
+        elif existing != profile and not is_duplicate(profile, existing):
+            wallets.update(existing, **profile.fields())
+            updated += 1
+    
+    for profile in wallets:
+        if profile.address not in seen_addresses and profile.address not in pending:
+            wallets.discard(profile)
+            removed += 1
+    return added, updated, removed
+
+def apply_changed_rows(rows):
+    """Brings the wallets in rows, an address -> row mapping with None for deleted wallets, in line with the database.
+
+    Returns False if a wallet couldn't be loaded because its username is taken in the store,
+    which means the store has drifted from the database.
+    """
+    pending = change_writer.pending_addresses()
+    
+    # Deleted and renamed wallets come out of the store first, so a username freed in this batch is free before another wallet takes it
+    renamed = []
+    for address, row in rows.items():
+        existing = wallets.by_address.get(address)
+        if existing is None:
+            continue
+        if row is None:
+            if address not in pending:
+                wallets.discard(existing)
+        elif row['username'] != existing.username:
+            wallets.discard(existing)
+            renamed.append((existing, row['username']))
+    
+    in_sync = True
+    for profile, username in renamed:
+        # Saves never write usernames in sharded mode, so the database's is right even for wallets with pending changes
+        profile.update({"username": username})
+        if is_duplicate(profile):
+            print(f"Could not rename {profile.address} to {username}: another wallet here already has that username.")
+            profile.update({"username": ""})
+            in_sync = False
+        wallets.add(profile)
+    
+    for address, row in rows.items():
+        if row is None:
+            continue
+        
+        profile_validator(row, wallets.by_address)
+        profile = Wallet.from_row(row)
+        existing = wallets.by_address.get(address)
+        if address in pending:
+            # Pending saves never write balances in sharded mode, so the database's balance is right even here.
+            # Skipping it would lose the change for good, since changes_since has already moved past it.
+            if existing is not None and existing.balance != profile.balance:
+                wallets.set_balance(existing, profile.balance)
+            continue
+        if is_duplicate(profile, existing):
+            print(f"Could not load {address} from the database: another wallet here already has the username {profile.username}.")
+            in_sync = False
+            continue
+        if existing is None:
+            wallets.add(profile)
+        elif existing != profile:
+            wallets.update(existing, **profile.fields())
+    return in_sync
+
+async def sync_shared_db():
+    """Picks up the wallets other processes changed since the last check."""
+    started = time.perf_counter()
+    rows = await asyncio.get_running_loop().run_in_executor(db_executor, backend.changes_since)
+    if rows is None:
+        # Too far behind to catch up from the changes table
+        await reload_db()
+        return
+    if rows:
+        if not apply_changed_rows(rows):
+            # The database keeps usernames unique, so start again from it
+            backend.data_version = None
+            await reload_db()
+        metrics.observe("splatchain_reload_seconds", time.perf_counter() - started)
+
+async def reload_db():
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        # Goes through db_executor so a reload never reads a write that is still in progress
+        if not await loop.run_in_executor(db_executor, backend.changed):
+            return
+        
+        profiles = await loop.run_in_executor(db_executor, backend.load)
+        if not profiles:
+            print("The database is empty. Keeping the wallets already loaded.")
+            return
+        
+        # Validated like on startup, so an outside edit loads the same way whether the bot reloads or restarts
+        added, updated, removed = apply_db_changes(validated_wallets(profiles))
+        print(f"Database reloaded ({added} added, {updated} updated, {removed} removed).")
+    finally:
+        metrics.observe("splatchain_reload_seconds", time.perf_counter() - started)
+
+async def watch_db():
+    """Reloads the database as soon as its files change, instead of waiting for the next periodic check."""
+    try:
+        from watchfiles import awatch
+    except ImportError:
+        print("WATCH_DB is enabled but the watchfiles package is not installed. Checking for changes every 5 minutes instead.")
+        return
+    
+    watched_files = {os.path.basename(path) for path in (db_file, journal_file, sqlite_file, sqlite_file + "-wal")}
+    async for _ in awatch(os.path.dirname(db_file), watch_filter=lambda change, path: os.path.basename(path) in watched_files):
+        async with profiler.trace_memory("reload"):
+            await reload_db()
+
+db_watcher = None
+
+# Startup
+startup_started = None # time.perf_counter() when main() was called
+startup_done = None # asyncio.Event, set once the wallets and the cached block list are loaded
+background_tasks = [] # kept so the tasks aren't garbage collected while running
+
+def load_wallets(timings):
+    """Opens the backend and fills the store, recording how long each phase took in timings."""
+    phase_started = time.perf_counter()
+    open_backend()
+    profiles = load_db()
+    timings['read'] = time.perf_counter() - phase_started
+    
+    phase_started = time.perf_counter()
+    profiles = validated_wallets(profiles)
+    timings['validate'] = time.perf_counter() - phase_started
+    
+    phase_started = time.perf_counter()
+    wallets.load(profiles)
+    timings['index'] = time.perf_counter() - phase_started
+    
+    # Repair mode rewrites the database with the fixes from the validation pass
+    if os.getenv('REPAIR_DB') == "true":
+        print("Repairing database.")
+        backend.replace_all([profile.to_row() for profile in wallets])
+
+def load_ledger_index(timings):
+    """Scans the ledger files before any command can record to them, so the first transfer doesn't hold up db_executor."""
+    started = time.perf_counter()
+    ledger.load_index()
+    timings['ledger'] = time.perf_counter() - started
+
+async def start_up():
+    """Loads the wallets and the cached block list while the bot connects to Discord, then starts the background tasks."""
+    global db_watcher
+    timings = {}
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.gather(
+            loop.run_in_executor(db_executor, load_wallets, timings),
+            asyncio.to_thread(load_cached_block_list) if block_list_enabled else asyncio.sleep(0),
+            # Sharded mode keeps the ledger in the database, which needs no index
+            asyncio.to_thread(load_ledger_index, timings) if not shared_db else asyncio.sleep(0)
+        )
+    except Exception as e:
+        # Carrying on with an empty store would overwrite the database on the first change
+        print(f"Could not load the database ({type(e).__name__}: {e}). Shutting down.")
+        await bot.close()
+        return
+    
+    print(f"Loaded {len(wallets):,} wallets (read {timings['read']:.2f}s, validated {timings['validate']:.2f}s, indexed {timings['index']:.2f}s, ledger {timings.get('ledger', 0):.2f}s, {time.perf_counter() - startup_started:.2f}s after start).")
+    
+    change_writer.start()
+    if metrics.enabled:
+        time_responses()
+        background_tasks.append(asyncio.create_task(measure_loop_lag()))
+    if metrics_port:
+        try:
+            await serve_metrics()
+        except OSError as e:
+            print(f"Could not serve metrics on port {metrics_port}: {e}")
+    if metrics_dump_interval:
+        metrics_dumper.start()
+    if os.getenv('WATCH_DB') == "true" and db_watcher is None:
+        db_watcher = asyncio.create_task(watch_db())
+    periodic_reload_db.start()
+    if shared_db:
+        shared_db_poller.start()
+    if journal_enabled and isinstance(backend, CSVBackend):
+        journal_compactor.start()
+    startup_done.set()
 
 # Discord bot setup
 intents = discord.Intents.default()
-intents.members = True # Privileged Discord Intent, may require verification if this bot goes public
+intents.members = os.getenv('MEMBERS_INTENT', "true") == "true" # Privileged Discord Intent, may require verification if this bot goes public
 intents.dm_messages = True
-bot = discord.Client(intents=intents)
-tree = app_commands.CommandTree(bot)
+
+# Sharded mode connects with AutoShardedClient, which runs every shard in shard_ids over one client
+client_options = {"shard_count": shard_count, "shard_ids": shard_ids} if shard_count else {}
+
+class SplatChainClient(discord.AutoShardedClient if shard_count else discord.Client):
+    async def setup_hook(self):
+        # Runs after logging in and before connecting to the gateway; loading carries on during the connection
+        global startup_done
+        startup_done = asyncio.Event()
+        background_tasks.append(asyncio.create_task(start_up()))
+
+bot = SplatChainClient(intents=intents, **client_options)
+
+class SplatChainTree(app_commands.CommandTree):
+    async def interaction_check(self, ctx: discord.Interaction) -> bool:
+        # Autocomplete runs this check too, but only commands reach on_app_command_completion,
+        # which stops their timing and profile
+        is_command = ctx.type == discord.InteractionType.application_command
+        if metrics.enabled and is_command:
+            command_started[ctx.id] = time.perf_counter()
+        
+        # Commands that arrive while the wallets are still loading wait for them
+        await startup_done.wait()
+        
+        # Runs before every command, so banned users are turned away in one place
+        started = time.perf_counter()
+        blocked = user_block_check(ctx.user)
+        metrics.observe("splatchain_block_check_seconds", time.perf_counter() - started)
+        if blocked:
+            if is_command:
+                await ctx.response.send_message(embed=banned_embed, ephemeral=True)
+            command_started.pop(ctx.id, None)
+            return False
+        
+        if ctx.user.id not in linked_owner_ids:
+            link_owner_id(ctx.user)
+        if is_command:
+            profiler.start_command(ctx)
+        return True
+
+    async def on_error(self, ctx: discord.Interaction, error: app_commands.AppCommandError):
+        profiler.finish_command(ctx, ctx.command.qualified_name if ctx.command else "unknown")
+        command_started.pop(ctx.id, None)
+        await super().on_error(ctx, error)
+
+tree = SplatChainTree(bot)
+
+# Command timing, only recorded when metrics are enabled
+command_started = {} # interaction ID -> time.perf_counter() when the command arrived
+
+@bot.event
+async def on_app_command_completion(ctx: discord.Interaction, command):
+    profiler.finish_command(ctx, command.qualified_name)
+    started = command_started.pop(ctx.id, None)
+    if started is not None:
+        metrics.observe("splatchain_command_seconds", time.perf_counter() - started, command=command.qualified_name)
+
+def time_responses():
+    """Wraps InteractionResponse.send_message to record when each command responded and how long sending took."""
+    send_message = discord.InteractionResponse.send_message
+    
+    async def timed_send_message(self, *args, **kwargs):
+        ctx = self._parent
+        started = command_started.get(ctx.id)
+        command = ctx.command.qualified_name if ctx.command else "unknown"
+        if started is not None:
+            metrics.observe("splatchain_response_seconds", time.perf_counter() - started, command=command)
+        
+        sending = time.perf_counter()
+        try:
+            return await send_message(self, *args, **kwargs)
+        finally:
+            metrics.observe("splatchain_response_send_seconds", time.perf_counter() - sending, command=command)
+    
+    discord.InteractionResponse.send_message = timed_send_message
+
+async def measure_loop_lag():
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(1)
+        metrics.observe("splatchain_event_loop_lag_seconds", time.perf_counter() - started - 1)
+        metrics.set("splatchain_wallets", len(wallets))
+
+async def serve_metrics():
+    from aiohttp import web
+    
+    async def handle(request):
+        return web.Response(text=metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+    
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, metrics_host, metrics_port).start()
+    print(f"Serving metrics on http://{metrics_host}:{metrics_port}/metrics")
+
+def write_metrics_file(text):
+    temp_file = metrics_file + ".tmp"
+    with open(temp_file, "w") as metrics_output:
+        metrics_output.write(text)
+    os.replace(temp_file, metrics_file)
+
+@tasks.loop(seconds=max(metrics_dump_interval, 1))
+async def metrics_dumper():
+    await asyncio.to_thread(write_metrics_file, metrics.render())
+
+# Profiling
+profiles_dir = "./data/profiles"
+
+class Profiler:
+    """Captures cProfile reports for the next few commands and tracemalloc reports for the next few saves or reloads.
+
+    Nothing is captured until PROFILE_COMMANDS, PROFILE_MEMORY or /profiler asks for it. Reports are
+    written to profiles_dir from a worker thread after the command has responded.
+    """
+
+    def __init__(self):
+        self.commands_left = int(os.getenv('PROFILE_COMMANDS', 0))
+        self.memory_left = int(os.getenv('PROFILE_MEMORY', 0))
+        self.active = None # (interaction ID, cProfile.Profile) for the command being captured
+        self.report_numbers = itertools.count(1)
+
+    def _report_path(self, name):
+        os.makedirs(profiles_dir, exist_ok=True)
+        return os.path.join(profiles_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{next(self.report_numbers)}-{name}")
+
+    def start_command(self, ctx):
+        # One command at a time; everything else running on the event loop meanwhile is captured too
+        if self.commands_left <= 0 or self.active is not None:
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return # another profiler is already running
+        self.commands_left -= 1
+        self.active = (ctx.id, profile)
+
+    def finish_command(self, ctx, name):
+        if self.active is None or self.active[0] != ctx.id:
+            return
+        profile = self.active[1]
+        profile.disable()
+        self.active = None
+        background_tasks.append(asyncio.create_task(asyncio.to_thread(self._write_command_report, profile, name)))
+
+    def _write_command_report(self, profile, name):
+        path = self._report_path(name.replace(" ", "-"))
+        profile.dump_stats(path + ".prof")
+        with open(path + ".txt", "w") as report:
+            pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(50)
+        print(f"Profile of /{name} written to {path}.txt")
+
+    @contextlib.asynccontextmanager
+    async def trace_memory(self, name):
+        if self.memory_left <= 0 or tracemalloc.is_tracing():
+            yield
+            return
+        
+        self.memory_left -= 1
+        tracemalloc.start(10)
+        try:
+            yield
+        finally:
+            snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            await asyncio.to_thread(self._write_memory_report, snapshot, current, peak, name)
+
+    def _write_memory_report(self, snapshot, current, peak, name):
+        path = self._report_path(name) + ".txt"
+        with open(path, "w") as report:
+            report.write(f"Allocated during {name}: {current:,} bytes still held, {peak:,} bytes at peak\n\n")
+            for statistic in snapshot.statistics("lineno")[:50]:
+                report.write(f"{statistic}\n")
+        print(f"Memory trace of {name} written to {path}")
+
+profiler = Profiler()
+
+def is_bot_owner(user):
+    application = bot.application
+    if application is None:
+        return False
+    if application.team:
+        return any(member.id == user.id for member in application.team.members)
+    return application.owner.id == user.id
+
+# Owner lookup
+linked_owner_ids = set() # users whose wallets already have their ID stored
+owner_cache = {} # user ID -> discord.User fetched from the API
+owner_cache_size = 1024
+
+def link_owner_id(user: discord.User):
+    """Stores the user's ID on wallets they own that were created before IDs were stored."""
+    unlinked = [profile for profile in wallets.owned_by(f"discord/{user.name}") if not profile.owner_id]
+    for profile in unlinked:
+        profile.owner_id = sys.intern(str(user.id))
+    if unlinked:
+        write_changes(*unlinked)
+    linked_owner_ids.add(user.id)
+
+async def find_owner(profile):
+    """Finds the Discord user who owns a wallet, or None if they can't be found."""
+    if profile.owner_id:
+        owner_id = int(profile.owner_id)
+        owner = bot.get_user(owner_id) or owner_cache.get(owner_id)
+        if owner is None:
+            try:
+                owner = await bot.fetch_user(owner_id)
+            except discord.HTTPException:
+                return None
+            if len(owner_cache) >= owner_cache_size:
+                del owner_cache[next(iter(owner_cache))]
+            owner_cache[owner_id] = owner
+        return owner
+    
+    # Wallets whose owner hasn't used the bot since IDs were stored can only be found by name
+    if intents.members:
+        return discord.utils.get(bot.get_all_members(), name=profile.owner.split("/")[1])
+    return None
+
+# Owner notifications
+notify_window = float(os.getenv('NOTIFY_WINDOW', 5.0)) # seconds
+
+class OwnerNotifier:
+    """Sends "Potentially Unauthorized Action" DMs in the background.
+
+    Commands queue a notification and respond right away. Notifications that arrive within
+    notify_window seconds of the first one are grouped, so each owner gets one DM per window.
+    """
+
+    def __init__(self):
+        self.queue = None
+        self.task = None
+        self.dm_channels = {} # user ID -> DMChannel
+
+    def notify(self, profile, description):
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self.run())
+        # A copy, so the owner can still be found if the wallet is deleted or claimed meanwhile
+        self.queue.put_nowait((profile.copy(), description))
+
+    async def run(self):
+        while True:
+            first = await self.queue.get()
+            await asyncio.sleep(notify_window)
+            
+            batches = {}
+            for profile, description in [first] + [self.queue.get_nowait() for _ in range(self.queue.qsize())]:
+                batches.setdefault(profile.owner_id or profile.owner, (profile, []))[1].append(description)
+            
+            # One at a time; discord.py waits out any rate limit before each send
+            for profile, descriptions in batches.values():
+                started = time.perf_counter()
+                try:
+                    await self.send(profile, descriptions)
+                except Exception as e:
+                    print(f"Could not notify the owner of {profile.username}: {e}")
+                metrics.observe("splatchain_owner_dm_seconds", time.perf_counter() - started)
+
+    async def dm_channel(self, owner):
+        channel = self.dm_channels.get(owner.id) or owner.dm_channel
+        if channel is None:
+            channel = await owner.create_dm()
+        self.dm_channels[owner.id] = channel
+        return channel
+
+    async def send(self, profile, descriptions):
+        owner = await find_owner(profile)
+        if owner is None:
+            return
+        
+        description = "\n".join(descriptions)
+        if len(description) > 4096:
+            description = description[:4093] + "..."
+        embed=discord.Embed(
+            title="Potentially Unauthorized Action",
+            description=description,
+            color=discord.colour.Color.red()
+        )
+        try:
+            await (await self.dm_channel(owner)).send(embed=embed)
+        except discord.Forbidden:
+            print(f"Could not send DM to {owner.name}.")
+
+owner_notifier = OwnerNotifier()
+
+startup_sweep_done = False # set once on_ready has checked every server
 
 @bot.event
 async def on_ready():
-    await tree.sync()
-    periodic_reload_db.start()
-    server_block_check.start()
+    global startup_sweep_done
+    # Commands are global, so one process syncing them is enough
+    if shard_ids is None or 0 in shard_ids:
+        await tree.sync()
+    print(f"Connected to Discord {time.perf_counter() - startup_started:.2f}s after start.")
+    await startup_done.wait()
+    # on_ready fires again after a full reconnect; after the first sweep, servers are only checked again when the list changes
+    if block_servers_enabled and not startup_sweep_done:
+        startup_sweep_done = True
+        await server_block_sweep()
     print("Ready")
 
+async def wallet_autocomplete(ctx: discord.Interaction, current: str):
+    choices = []
+    for profile in wallets.complete(current, f"discord/{ctx.user.name}"):
+        name = f"{profile.nickname} ({profile.username or profile.address})"
+        choices.append(app_commands.Choice(name=name[:100], value=profile.username or profile.address))
+    return choices
+
 @tree.command(name="about", description="Print about information for the SplatChain bot.")
 async def about(ctx: discord.Interaction):
-    if user_block_check(ctx.user):
-        embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
-            color=discord.colour.Color.red()
-        )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-        await ctx.response.send_message(embed=embed, ephemeral=True)
-        return
-    
     embed=discord.Embed(
         title="About SplatChain",
         description="SplatChain is a fictional cryptocurrency system created for Splatoon roleplays.",
@@ -172,30 +2177,21 @@ async def about(ctx: discord.Interaction):
 
 @tree.command(name="info", description="List information about a wallet.")    
 @app_commands.describe(wallet="The address or username of the wallet to look up.", show="Display this message in the channel (usually this message is private).")
+@app_commands.autocomplete(wallet=wallet_autocomplete)
 async def list_info(ctx: discord.Interaction, wallet: str, show: bool=False):
-    if user_block_check(ctx.user):
-        embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
-            color=discord.colour.Color.red()
-        )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-        await ctx.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    profile = next((profile for profile in profiles if profile["address"] == wallet or profile["username"] == wallet), None)
+    profile = wallets.get(wallet)
     
     if profile:
         embed=discord.Embed(
             title=f"Profile Information",
             color=discord.colour.Color.green()
         )
-        embed.add_field(name="Address", value=profile["address"], inline=False)
-        embed.add_field(name="Nickname", value=profile["nickname"], inline=False)
-        embed.add_field(name="Username", value=profile["username"], inline=False)
-        embed.add_field(name="Type", value=profile["type"], inline=False)
-        embed.add_field(name="Owner", value=profile["owner"], inline=False)
-        embed.add_field(name="Balance", value=f"{int(profile['balance']):,} SPLC", inline=False)
+        embed.add_field(name="Address", value=profile.address, inline=False)
+        embed.add_field(name="Nickname", value=profile.nickname, inline=False)
+        embed.add_field(name="Username", value=profile.username, inline=False)
+        embed.add_field(name="Type", value=profile.type, inline=False)
+        embed.add_field(name="Owner", value=profile.owner, inline=False)
+        embed.add_field(name="Balance", value=f"{profile.balance:,} SPLC", inline=False)
         
         if not show:
             embed.set_footer(text="To show this wallet to server members, rerun this command with 'show' set to true.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
@@ -211,17 +2207,7 @@ async def list_info(ctx: discord.Interaction, wallet: str, show: bool=False):
     app_commands.Choice(name="Business", value="Business")
 ])
 async def new_wallet(ctx: discord.Interaction, nickname: str, username: str, type:str="Person", startingbalance:int=0, share: bool=False):
-    if user_block_check(ctx.user):
-        embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
-            color=discord.colour.Color.red()
-        )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-        await ctx.response.send_message(embed=embed, ephemeral=True)
-        return
-
-    new_address = "".join(secrets.choice("0123456789abcdefABCDEF") for _ in range(40))
+    new_address = generate_address(wallets.by_address)
     
     if not username.endswith(".ink") or not re.match(r"^[a-z0-9.]+$", username):
         embed=discord.Embed(
@@ -232,17 +2218,18 @@ async def new_wallet(ctx: discord.Interaction, nickname: str, username: str, typ
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
     
-    new_profile = {
-        "address": new_address,
-        "nickname": nickname,
-        "username": username,
-        "type": type,
-        "owner": f"discord/{ctx.user.name}",
-        "balance": str(startingbalance),
-        "share": share
-    }
+    new_profile = Wallet(
+        address=new_address,
+        nickname=nickname,
+        username=username,
+        type=type,
+        owner=f"discord/{ctx.user.name}",
+        balance=startingbalance,
+        share=share,
+        owner_id=str(ctx.user.id)
+    )
             
-    if is_duplicate(new_profile):
+    if is_duplicate(new_profile) or not await add_wallet(new_profile):
         embed=discord.Embed(
             title="Duplicate Username",
             description="A wallet with that username already exists. Try a different username.",
@@ -251,48 +2238,35 @@ async def new_wallet(ctx: discord.Interaction, nickname: str, username: str, typ
         embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
-            
-    profiles.append(new_profile)
-    write_changes()
     
     embed=discord.Embed(
         title="New Wallet Created",
         color=discord.colour.Color.green()
     )
-    embed.add_field(name="Address", value=new_profile["address"], inline=False)
-    embed.add_field(name="Nickname", value=new_profile["nickname"], inline=False)
-    embed.add_field(name="Username", value=new_profile["username"], inline=False)
-    embed.add_field(name="Type", value=new_profile["type"], inline=False)
-    embed.add_field(name="Owner", value=new_profile["owner"], inline=False)
-    embed.add_field(name="Balance", value=f"{int(new_profile['balance']):,} SPLC", inline=False)
-    embed.add_field(name="Sharing Enabled", value=str(new_profile["share"]), inline=False)
+    embed.add_field(name="Address", value=new_profile.address, inline=False)
+    embed.add_field(name="Nickname", value=new_profile.nickname, inline=False)
+    embed.add_field(name="Username", value=new_profile.username, inline=False)
+    embed.add_field(name="Type", value=new_profile.type, inline=False)
+    embed.add_field(name="Owner", value=new_profile.owner, inline=False)
+    embed.add_field(name="Balance", value=f"{new_profile.balance:,} SPLC", inline=False)
+    embed.add_field(name="Sharing Enabled", value=str(new_profile.share), inline=False)
     embed.set_footer(text="Use the /about command to learn more about the bot.\nIt is recommended to run /testdm to make sure that I can send you DMs.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
     await ctx.response.send_message(embed=embed, ephemeral=True)
 
 @tree.command(name="delete", description="Delete a wallet.")
 @app_commands.describe(wallet="The address or username of the wallet to delete.", force="Allow deleting a wallet that you do not own. (this will notify the wallet's owner!)")
+@app_commands.autocomplete(wallet=wallet_autocomplete)
 async def delete_wallet(ctx: discord.Interaction, wallet: str, force: bool=False):
-    if user_block_check(ctx.user):
-        embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
-            color=discord.colour.Color.red()
-        )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-        await ctx.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    to_remove = wallet
-    profile = next((profile for profile in profiles if profile["address"] == to_remove or profile["username"] == to_remove), None)
+    profile = wallets.get(wallet)
     if profile:
-        if profile["owner"] != f"discord/{ctx.user.name}" and not force:
+        if profile.owner != f"discord/{ctx.user.name}" and not force:
             embed=discord.Embed(
                 title="Did you mean to do that?",
                 description="**You just tried to delete a wallet that you don't own.**\nDouble-check what you entered.\n\n*If you really meant that, try again with 'force' set to true.*",
                 color=discord.colour.Color.red()
             )
             
-            if profile['share']:
+            if profile.share:
                 embed.set_footer(text="Performing destructive actions on a wallet you don't own will notify its owner!\nThis wallet has sharing enabled, but that does NOT mean you can delete it.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
             else:
                 embed.set_footer(text="Performing destructive actions on a wallet you don't own will notify its owner!\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
@@ -300,21 +2274,10 @@ async def delete_wallet(ctx: discord.Interaction, wallet: str, force: bool=False
             await ctx.response.send_message(embed=embed, ephemeral=True)
             return
     
-        if profile['owner'] != f"discord/{ctx.user.name}" and force:
-            owner_name = profile['owner'].split("/")[1]
-            owner = discord.utils.get(bot.get_all_members(), name=owner_name)
-            if owner:
-                embed=discord.Embed(
-                    title="Potentially Unauthorized Action",
-                    description=f"{ctx.user.mention} deleted {profile['username']}.",
-                    color=discord.colour.Color.red()
-                )
-                try:
-                    await owner.send(embed=embed)
-                except discord.Forbidden:
-                    print(f"Could not send DM to {owner_name}.")
+        if profile.owner != f"discord/{ctx.user.name}" and force:
+            owner_notifier.notify(profile, f"{ctx.user.mention} deleted {profile.username}.")
         
-        profiles.remove(profile)
+        wallets.remove(profile)
         write_changes()
         await ctx.response.send_message("Wallet deleted.", ephemeral=True)
     else:
@@ -328,38 +2291,125 @@ async def delete_wallet(ctx: discord.Interaction, wallet: str, force: bool=False
         
 @tree.command(name="transfer", description="Transfer SPLC between wallets.")
 @app_commands.describe(fromwallet="The address or username of the sender.", towallet="The address or username of the receiver.", amount="The amount of SPLC to transfer.", show="Show the transfer message, even if you own both wallets.", force="Allow transferring from a wallet that you do not own. (this will notify the wallet's owner!)")
+@app_commands.autocomplete(fromwallet=wallet_autocomplete, towallet=wallet_autocomplete)
 async def transfer(ctx: discord.Interaction, fromwallet: str, towallet: str, amount: int, force: bool=False, show: bool=False):
-    if user_block_check(ctx.user):
+    if amount <= 0:
+        await ctx.response.send_message("Amount must be positive.", ephemeral=True)
+        return
+    
+    from_profile = wallets.get(fromwallet)
+    to_profile = wallets.get(towallet)
+
+    if not from_profile or not to_profile:
+        embed = discord.Embed(
+            title="Wallet Not Found",
+            description="An address or username you gave does not exist.",
+            color=discord.colour.Color.red()
+        )
+        embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
+        await ctx.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    if from_profile.owner != f"discord/{ctx.user.name}" and not force:
         embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
+            title="Did you mean to do that?",
+            description="**You just tried to transfer from a wallet that you don't own.**\nDouble-check what you entered.\n\n*If you really meant that, try again with 'force' set to true.*",
             color=discord.colour.Color.red()
         )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
+        
+        if from_profile.share:
+            embed.set_footer(text="This wallet has sharing enabled. Its owner will not be notified if you force this action.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
+        else:
+            embed.set_footer(text="Performing destructive actions on a wallet you don't own will notify its owner!\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
+        
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
     
-    from_profile = next((profile for profile in profiles if profile["address"] == fromwallet or profile["username"] == fromwallet), None)
-    to_profile = next((profile for profile in profiles if profile["address"] == towallet or profile["username"] == towallet), None)
-
-    if not from_profile or not to_profile:
+    if from_profile.owner != f"discord/{ctx.user.name}" and force and not from_profile.share:
+        owner_notifier.notify(from_profile, f"{ctx.user.mention} transferred {amount} SPLC from {from_profile.username} to {to_profile.username}.")
+    
+    try:
+        await transactions.transfer(from_profile, to_profile, amount, f"discord/{ctx.user.name}")
+    except InsufficientBalance as e:
+        embed=discord.Embed(
+            title="Insufficient Balance",
+            description="The sender does not have enough SPLC to transfer that amount.",
+            color=discord.colour.Color.red()
+        )
+        embed.add_field(name="Sender Balance", value=f"{e.balance:,} SPLC", inline=False)
+        embed.add_field(name="Amount Requested", value=f"{amount:,} SPLC", inline=False)
+        embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
+        await ctx.response.send_message(embed=embed, ephemeral=True)
+        return
+    except WalletNotFound:
         embed = discord.Embed(
             title="Wallet Not Found",
             description="An address or username you gave does not exist.",
             color=discord.colour.Color.red()
         )
+        await ctx.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    if from_profile.owner == f"discord/{ctx.user.name}" and to_profile.owner == f"discord/{ctx.user.name}" and not show:
+        # Hide the message from others if both wallets are owned by the same user
+        await ctx.response.send_message(f"{amount:,} SPLC transferred from {from_profile.username} to {to_profile.username}.", ephemeral=True)
+    else:
+        await ctx.response.send_message(f"{from_profile.username} sent {amount:,} SPLC to {to_profile.username}.")
+    
+def parse_payments(text):
+    """Parses "wallet:amount" pairs separated by commas or new lines into (wallet, amount) pairs."""
+    payments = []
+    for entry in re.split(r"[,\n]+", text):
+        entry = entry.strip()
+        if not entry:
+            continue
+        wallet, separator, amount = entry.rpartition(":")
+        if not separator or not wallet.strip() or not amount.strip().isdigit():
+            raise ValueError(f"`{entry}` is not in the form wallet:amount.")
+        if int(amount) == 0:
+            raise ValueError(f"The amount for {wallet.strip()} must be nonzero.")
+        payments.append((wallet.strip(), int(amount)))
+    if not payments:
+        raise ValueError("No payments were given.")
+    return payments
+
+@tree.command(name="payout", description="Pay SPLC from one wallet to several wallets at once.")
+@app_commands.describe(fromwallet="The address or username of the sender.", payments="Who to pay, as wallet:amount pairs separated by commas (e.g. alice.ink:500, bob.ink:250).", show="Show the payout message, even if you own every wallet.", force="Allow paying out from a wallet that you do not own. (this will notify the wallet's owner!)")
+@app_commands.autocomplete(fromwallet=wallet_autocomplete)
+async def payout(ctx: discord.Interaction, fromwallet: str, payments: str, force: bool=False, show: bool=False):
+    try:
+        parsed_payments = parse_payments(payments)
+    except ValueError as e:
+        embed=discord.Embed(
+            title="Invalid Input",
+            description=f"{e}\nPayments must be wallet:amount pairs separated by commas, like `alice.ink:500, bob.ink:250`.",
+            color=discord.colour.Color.red()
+        )
+        await ctx.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    from_profile = wallets.get(fromwallet)
+    to_profiles = [(wallets.get(wallet), amount) for wallet, amount in parsed_payments]
+    missing = [wallet for (wallet, _), (to_profile, _) in zip(parsed_payments, to_profiles) if not to_profile]
+    
+    if not from_profile or missing:
+        embed = discord.Embed(
+            title="Wallet Not Found",
+            description="An address or username you gave does not exist." + (f"\nNot found: {', '.join(missing)}" if missing else ""),
+            color=discord.colour.Color.red()
+        )
         embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
     
-    if from_profile["owner"] != f"discord/{ctx.user.name}" and not force:
+    if from_profile.owner != f"discord/{ctx.user.name}" and not force:
         embed=discord.Embed(
             title="Did you mean to do that?",
-            description="**You just tried to transfer from a wallet that you don't own.**\nDouble-check what you entered.\n\n*If you really meant that, try again with 'force' set to true.*",
+            description="**You just tried to pay out from a wallet that you don't own.**\nDouble-check what you entered.\n\n*If you really meant that, try again with 'force' set to true.*",
             color=discord.colour.Color.red()
         )
         
-        if from_profile['share']:
+        if from_profile.share:
             embed.set_footer(text="This wallet has sharing enabled. Its owner will not be notified if you force this action.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
         else:
             embed.set_footer(text="Performing destructive actions on a wallet you don't own will notify its owner!\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
@@ -367,71 +2417,85 @@ async def transfer(ctx: discord.Interaction, fromwallet: str, towallet: str, amo
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
     
-    if from_profile['owner'] != f"discord/{ctx.user.name}" and force and not from_profile['share']:
-            owner_name = profile['owner'].split("/")[1]
-            owner = discord.utils.get(bot.get_all_members(), name=owner_name)
-            if owner:
-                embed=discord.Embed(
-                    title="Potentially Unauthorized Action",
-                    description=f"{ctx.user.mention} transferred {amount} SPLC from {from_profile['username']} to {to_profile['username']}.",
-                    color=discord.colour.Color.red()
-                )
-                try:
-                    await owner.send(embed=embed)
-                except discord.Forbidden:
-                    print(f"Could not send DM to {owner_name}.")
+    total = sum(amount for _, amount in to_profiles)
     
-    if int(from_profile["balance"]) < amount:
+    if from_profile.owner != f"discord/{ctx.user.name}" and force and not from_profile.share:
+        owner_notifier.notify(from_profile, f"{ctx.user.mention} paid out {total:,} SPLC from {from_profile.username} to {len(to_profiles)} wallets.")
+    
+    try:
+        await transactions.payout(from_profile, to_profiles, f"discord/{ctx.user.name}")
+    except InsufficientBalance as e:
         embed=discord.Embed(
             title="Insufficient Balance",
-            description="The sender does not have enough SPLC to transfer that amount.",
+            description="The sender does not have enough SPLC to pay out that much.",
             color=discord.colour.Color.red()
         )
-        embed.add_field(name="Sender Balance", value=f"{int(from_profile['balance']):,} SPLC", inline=False)
-        embed.add_field(name="Amount Requested", value=f"{amount:,} SPLC", inline=False)
+        embed.add_field(name="Sender Balance", value=f"{e.balance:,} SPLC", inline=False)
+        embed.add_field(name="Total Requested", value=f"{total:,} SPLC", inline=False)
         embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
-
-    from_profile["balance"] = str(int(from_profile["balance"]) - amount)
-    to_profile["balance"] = str(int(to_profile["balance"]) + amount)
-    write_changes()
+    except WalletNotFound:
+        embed = discord.Embed(
+            title="Wallet Not Found",
+            description="An address or username you gave does not exist.",
+            color=discord.colour.Color.red()
+        )
+        await ctx.response.send_message(embed=embed, ephemeral=True)
+        return
     
-    if from_profile['owner'] == f"discord/{ctx.user.name}" and to_profile['owner'] == f"discord/{ctx.user.name}" and not show:
-        # Hide the message from others if both wallets are owned by the same user
-        await ctx.response.send_message(f"{amount:,} SPLC transferred from {from_profile['username']} to {to_profile['username']}.", ephemeral=True)
-    else:
-        await ctx.response.send_message(f"{from_profile['username']} sent {amount:,} SPLC to {to_profile['username']}.")
+    # Embed descriptions are capped at 4096 characters
+    lines = []
+    length = 0
+    for to_profile, amount in to_profiles:
+        line = f"{to_profile.username}: {amount:,} SPLC"
+        length += len(line) + 1
+        if length > 4000:
+            lines.append(f"...and {len(to_profiles) - len(lines)} more")
+            break
+        lines.append(line)
+    description = "\n".join(lines)
+    
+    embed=discord.Embed(
+        title=f"{from_profile.username} paid out {total:,} SPLC",
+        description=description,
+        color=discord.colour.Color.green()
+    )
+    embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
     
+    everything_owned = from_profile.owner == f"discord/{ctx.user.name}" and all(to_profile.owner == f"discord/{ctx.user.name}" for to_profile, _ in to_profiles)
+    # Hide the message from others if every wallet is owned by the same user, like /transfer
+    await ctx.response.send_message(embed=embed, ephemeral=(everything_owned and not show))
+
 @tree.command(name="edit", description="Edit a wallet's profile or balance.")
 @app_commands.describe(wallet="The address or username of the wallet to edit.", nickname="The new nickname for the wallet.", username="The new username for the wallet.", type="The new type for the wallet.", balance="The new balance for the wallet.", share="Allow others to perform destructive actions on this wallet without the bot DMing you.", force="Allow editing a wallet that you do not own. (this will notify the wallet's owner!)", claim="Take ownership of the wallet.")
+@app_commands.autocomplete(wallet=wallet_autocomplete)
 @app_commands.choices(type=[
     app_commands.Choice(name="Person", value="Person"),
     app_commands.Choice(name="Business", value="Business")
 ])
 async def edit_profile(ctx: discord.Interaction, wallet: str, nickname: str="", username: str="", type: str="", balance: int=0, share: bool=False, force: bool=False, claim: bool=False):
-    if user_block_check(ctx.user):
-        embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
+    profile = wallets.get(wallet)
+    
+    if not profile:
+        embed = discord.Embed(
+            title="Wallet Not Found",
+            description="An address or username you gave does not exist.",
             color=discord.colour.Color.red()
         )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
     
-    input_address = wallet
-    profile = next((profile for profile in profiles if profile["address"] == input_address or profile["username"] == input_address), None)
     old_profile = profile.copy()
     
-    if profile["owner"] != f"discord/{ctx.user.name}" and not force:
+    if profile.owner != f"discord/{ctx.user.name}" and not force:
         embed=discord.Embed(
             title="Did you mean to do that?",
             description="**You just tried to edit a wallet that you don't own.**\nDouble-check what you entered.\n\n*If you really meant that, try again with 'force' set to true.*",
             color=discord.colour.Color.red()
         )
         
-        if profile['share']:
+        if profile.share:
             embed.set_footer(text="Performing destructive actions on a wallet you don't own will notify its owner!\nThis wallet has sharing enabled, but that does NOT mean you can edit it.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
         else:
             embed.set_footer(text="Performing destructive actions on a wallet you don't own will notify its owner!\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
@@ -439,97 +2503,89 @@ async def edit_profile(ctx: discord.Interaction, wallet: str, nickname: str="",
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
     
-    if profile['owner'] != f"discord/{ctx.user.name}" and force:
-            owner_name = profile['owner'].split("/")[1]
-            owner = discord.utils.get(bot.get_all_members(), name=owner_name)
-            if owner:
-                embed=discord.Embed(
-                    title="Potentially Unauthorized Action",
-                    description=f"{ctx.user.mention} edited {profile['username']}.",
-                    color=discord.colour.Color.red()
-                )
-                try:
-                    await owner.send(embed=embed)
-                except discord.Forbidden:
-                    print(f"Could not send DM to {owner_name}.")
+    if profile.owner != f"discord/{ctx.user.name}" and force:
+        owner_notifier.notify(profile, f"{ctx.user.mention} edited {profile.username}.")
     
-    if profile:
-        if nickname:
-            profile["nickname"] = nickname
-            
-        if username:
-            if not username.endswith(".ink") or not re.match(r"^[a-z0-9.]+$", username):
-                await ctx.response.send_message("Invalid username. Usernames must end in .ink and contain only lowercase letters, numbers, and periods.", ephemeral=True)
-                return
-            profile["username"] = username
-            
-        if type:
-            profile["type"] = type
-        
-        if balance != 0:
-            profile["balance"] = str(balance)
-            
-        if claim:
-            profile["owner"] = f"discord/{ctx.user.name}"
-            
-        profile['share'] = share
+    changes = {}
+    
+    if nickname:
+        changes["nickname"] = nickname
         
-        if is_duplicate(profile):
-            profiles[profiles.index(profile)] = old_profile.copy()
-            embed=discord.Embed(
-                title="Duplicate Username",
-                description="A wallet with that username already exists. Try a different username.",
-                color=discord.colour.Color.red()
-            )
-            await ctx.response.send_message(embed=embed, ephemeral=True)
+    if username:
+        if not username.endswith(".ink") or not re.match(r"^[a-z0-9.]+$", username):
+            await ctx.response.send_message("Invalid username. Usernames must end in .ink and contain only lowercase letters, numbers, and periods.", ephemeral=True)
             return
+        changes["username"] = username
         
-        write_changes()
+    if type:
+        changes["type"] = WalletType(type)
+    
+    if claim:
+        changes["owner"] = f"discord/{ctx.user.name}"
+        changes["owner_id"] = str(ctx.user.id)
         
+    changes['share'] = share
+    
+    if is_duplicate(profile.copy(**changes), profile):
         embed=discord.Embed(
-            title="Profile Updated",
-            color=discord.colour.Color.green()
-        )
-        
-        if nickname:
-            embed.add_field(name="New Nickname", value=f"{nickname} (was {old_profile['nickname']})", inline=False)
-        if username:
-            embed.add_field(name="New Username", value=f"{username} (was {old_profile['username']})", inline=False)
-        if type:
-            embed.add_field(name="New Type", value=f"{type} (was {old_profile['type']})", inline=False)
-        if balance:
-            embed.add_field(name="New Balance", value=f"{balance:,} SPLC (was {int(old_profile['balance']):,} SPLC)", inline=False)
-        if claim:
-            embed.add_field(name="New Owner", value=f"discord/{ctx.user.name} (was {old_profile['owner']})", inline=False)
-        if share:
-            if old_profile['share']:
-                embed.add_field(name="New Sharing Enabled State", value=f"{share} (was {old_profile['share']})", inline=False)
-            else:
-                embed.add_field(name="New Sharing Enabled State", value=f"{share} (was {old_profile['share']})\nSharing Enabled means that others can transfer from or edit this wallet without you being notified.", inline=False)
-
-        embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
-        await ctx.response.send_message(embed=embed, ephemeral=True)
-    else:
-        embed = discord.Embed(
-            title="Wallet Not Found",
-            description="An address or username you gave does not exist.",
+            title="Duplicate Username",
+            description="A wallet with that username already exists. Try a different username.",
             color=discord.colour.Color.red()
         )
         await ctx.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    # Takes the wallet's lock so a balance set here can't interleave with a transfer
+    async with transactions.locked(profile):
+        if shared_db and "username" in changes:
+            # The database decides, since another process may have taken the username a moment ago
+            if not await asyncio.get_running_loop().run_in_executor(db_executor, backend.rename_wallet, profile.address, changes["username"]):
+                embed=discord.Embed(
+                    title="Duplicate Username",
+                    description="A wallet with that username already exists. Try a different username.",
+                    color=discord.colour.Color.red()
+                )
+                await ctx.response.send_message(embed=embed, ephemeral=True)
+                return
+        wallets.update(profile, **changes)
+        write_changes(profile)
+        if balance != 0:
+            try:
+                previous_balance = await transactions.set_balance(profile, balance)
+            except WalletNotFound:
+                await ctx.response.send_message("That wallet was deleted before its balance could be changed.", ephemeral=True)
+                return
+            if profile.balance != previous_balance:
+                ledger.record([ledger_entry(profile, "edit", profile.balance - previous_balance, f"discord/{ctx.user.name}")])
+    
+    embed=discord.Embed(
+        title="Profile Updated",
+        color=discord.colour.Color.green()
+    )
+    
+    if nickname:
+        embed.add_field(name="New Nickname", value=f"{nickname} (was {old_profile.nickname})", inline=False)
+    if username:
+        embed.add_field(name="New Username", value=f"{username} (was {old_profile.username})", inline=False)
+    if type:
+        embed.add_field(name="New Type", value=f"{type} (was {old_profile.type})", inline=False)
+    if balance:
+        embed.add_field(name="New Balance", value=f"{balance:,} SPLC (was {old_profile.balance:,} SPLC)", inline=False)
+    if claim:
+        embed.add_field(name="New Owner", value=f"discord/{ctx.user.name} (was {old_profile.owner})", inline=False)
+    if share:
+        if old_profile.share:
+            embed.add_field(name="New Sharing Enabled State", value=f"{share} (was {old_profile.share})", inline=False)
+        else:
+            embed.add_field(name="New Sharing Enabled State", value=f"{share} (was {old_profile.share})\nSharing Enabled means that others can transfer from or edit this wallet without you being notified.", inline=False)
+
+    embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
+    await ctx.response.send_message(embed=embed, ephemeral=True)
 
 @tree.command(name="inject", description="Inject SPLC into a wallet.")
 @app_commands.describe(wallet="The address or username of the wallet to inject into.", amount="The amount of SPLC to inject.", force="Allow injecting into a wallet that you do not own.")
+@app_commands.autocomplete(wallet=wallet_autocomplete)
 async def inject_splc(ctx: discord.Interaction, wallet: str, amount: int, force: bool=False):
-    if user_block_check(ctx.user):
-        embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
-            color=discord.colour.Color.red()
-        )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-        await ctx.response.send_message(embed=embed, ephemeral=True)
-        return
-    
     if int(amount) < 0:
         await ctx.response.send_message("Amount must be positive.", ephemeral=True)
         return
@@ -538,9 +2594,9 @@ async def inject_splc(ctx: discord.Interaction, wallet: str, amount: int, force:
         await ctx.response.send_message("Amount must be nonzero.", ephemeral=True)
         return
     
-    profile = next((profile for profile in profiles if profile["address"] == wallet or profile["username"] == wallet), None)
+    profile = wallets.get(wallet)
     if profile:
-        if profile["owner"] != f"discord/{ctx.user.name}" and not force:
+        if profile.owner != f"discord/{ctx.user.name}" and not force:
             embed=discord.Embed(
                 title="Did you mean to do that?",
                 description="**You just tried to inject SPLC a wallet that you don't own.**\nDouble-check what you entered.\n\n*If you really meant that, try again with 'force' set to true.*",
@@ -551,9 +2607,12 @@ async def inject_splc(ctx: discord.Interaction, wallet: str, amount: int, force:
             return
         
         
-        profile["balance"] = str(int(profile["balance"]) + int(amount))
-        write_changes()
-        await ctx.response.send_message(f"{amount:,} SPLC injected into {profile['username']}.", ephemeral=True)
+        try:
+            await transactions.inject(profile, amount, f"discord/{ctx.user.name}")
+        except WalletNotFound:
+            await ctx.response.send_message("That wallet was deleted before SPLC could be injected.", ephemeral=True)
+            return
+        await ctx.response.send_message(f"{amount:,} SPLC injected into {profile.username}.", ephemeral=True)
     else:
         embed = discord.Embed(
             title="Wallet Not Found",
@@ -564,17 +2623,8 @@ async def inject_splc(ctx: discord.Interaction, wallet: str, amount: int, force:
         
 @tree.command(name="burn", description="Burn SPLC from a wallet.")
 @app_commands.describe(wallet="The address or username of the wallet to burn from.", amount="The amount of SPLC to burn.", force="Allow burning from a wallet that you do not own. (this will notify the wallet's owner!)")
+@app_commands.autocomplete(wallet=wallet_autocomplete)
 async def burn_splc(ctx: discord.Interaction, wallet: str, amount: int, force: bool=False):
-    if user_block_check(ctx.user):
-        embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
-            color=discord.colour.Color.red()
-        )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-        await ctx.response.send_message(embed=embed, ephemeral=True)
-        return
-    
     if int(amount) < 0:
         await ctx.response.send_message("Amount must be positive.", ephemeral=True)
         return
@@ -583,17 +2633,17 @@ async def burn_splc(ctx: discord.Interaction, wallet: str, amount: int, force: b
         await ctx.response.send_message("Amount must be nonzero.", ephemeral=True)
         return
     
-    profile = next((profile for profile in profiles if profile["address"] == wallet or profile["username"] == wallet), None)
+    profile = wallets.get(wallet)
     
     if profile:
-        if profile["owner"] != f"discord/{ctx.user.name}" and not force:
+        if profile.owner != f"discord/{ctx.user.name}" and not force:
             embed=discord.Embed(
                 title="Did you mean to do that?",
                 description="**You just tried to burn SPLC from a wallet that you don't own.**\nDouble-check what you entered.\n\n*If you really meant that, try again with 'force' set to true.*",
                 color=discord.colour.Color.red()
             )
             
-            if profile['share']:
+            if profile.share:
                 embed.set_footer(text="This wallet has sharing enabled. Its owner will not be notified if you force this action.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
             else:
                 embed.set_footer(text="Performing destructive actions on a wallet you don't own will notify its owner!\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
@@ -601,34 +2651,24 @@ async def burn_splc(ctx: discord.Interaction, wallet: str, amount: int, force: b
             await ctx.response.send_message(embed=embed, ephemeral=True)
             return
     
-        if profile['owner'] != f"discord/{ctx.user.name}" and force:
-            owner_name = profile['owner'].split("/")[1]
-            owner = discord.utils.get(bot.get_all_members(), name=owner_name)
-            if owner:
-                embed=discord.Embed(
-                    title="Potentially Unauthorized Action",
-                    description=f"{ctx.user.mention} burned {amount} SPLC from {profile['username']}.",
-                    color=discord.colour.Color.red()
-                )
-                try:
-                    await owner.send(embed=embed)
-                except discord.Forbidden:
-                    print(f"Could not send DM to {owner_name}.")
-        
-        if int(profile["balance"]) >= amount:
-            profile["balance"] = str(int(profile["balance"]) - amount)
-            write_changes()
-            await ctx.response.send_message(f"{amount:,} SPLC burned from {profile['username']}.", ephemeral=True)
-        else:
+        if profile.owner != f"discord/{ctx.user.name}" and force:
+            owner_notifier.notify(profile, f"{ctx.user.mention} burned {amount} SPLC from {profile.username}.")
+        
+        try:
+            await transactions.burn(profile, amount, f"discord/{ctx.user.name}")
+            await ctx.response.send_message(f"{amount:,} SPLC burned from {profile.username}.", ephemeral=True)
+        except InsufficientBalance as e:
             embed = discord.Embed(
                 title="Insufficient Balance",
                 description="The wallet does not have enough SPLC to burn that amount.",
                 color=discord.colour.Color.red()
             )
-            embed.add_field(name="Current Balance", value=f"{int(profile['balance']):,} SPLC", inline=False)
+            embed.add_field(name="Current Balance", value=f"{e.balance:,} SPLC", inline=False)
             embed.add_field(name="Amount Requested", value=f"{amount:,} SPLC", inline=False)
             embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
             await ctx.response.send_message(embed=embed, ephemeral=True)
+        except WalletNotFound:
+            await ctx.response.send_message("That wallet was deleted before SPLC could be burned.", ephemeral=True)
     else:
         embed = discord.Embed(
             title="Wallet Not Found",
@@ -637,25 +2677,194 @@ async def burn_splc(ctx: discord.Interaction, wallet: str, amount: int, force: b
         )
         await ctx.response.send_message(embed=embed, ephemeral=True)
         
-@tree.command(name="mywallets", description="List all wallets you own.")
-@app_commands.describe(show="Display this message in the channel (usually this message is private).")
-async def my_wallets(ctx: discord.Interaction, show: bool=False):
-    if user_block_check(ctx.user):
+history_page_size = 10
+history_event_names = {"transfer": "Transfer", "payout": "Payout", "inject": "Inject", "burn": "Burn", "edit": "Balance Edit"}
+
+class HistoryView(discord.ui.View):
+    """Pages through a wallet's history, reading each page from the ledger only when it is shown."""
+
+    def __init__(self, user_id, address, name):
+        super().__init__(timeout=300)
+        self.user_id = user_id
+        self.address = address
+        self.name = name
+        self.page = 0
+        self.total = 0
+
+    async def render(self):
+        entries, self.total = await asyncio.get_running_loop().run_in_executor(db_executor, ledger.read, self.address, self.page * history_page_size, history_page_size)
+        pages = max((self.total + history_page_size - 1) // history_page_size, 1)
+        
         embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
+            title=f"History for {self.name}",
+            color=discord.colour.Color.green()
+        )
+        if entries:
+            lines = []
+            for entry in entries:
+                line = f"<t:{entry['time']}:f> **{history_event_names.get(entry['event'], entry['event'])}** {entry['change']:+,} SPLC, balance {entry['balance']:,} SPLC"
+                if entry.get('note'):
+                    line += f" ({entry['note']})"
+                if entry.get('actor'):
+                    line += f" by {entry['actor']}"
+                lines.append(line)
+            embed.description = "\n".join(lines)
+        else:
+            embed.description = "No history for this wallet yet."
+        embed.set_footer(text=f"Page {self.page + 1} of {pages}\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
+        
+        self.newer.disabled = self.page == 0
+        self.older.disabled = (self.page + 1) * history_page_size >= self.total
+        return embed
+
+    async def interaction_check(self, ctx: discord.Interaction) -> bool:
+        return ctx.user.id == self.user_id
+
+    @discord.ui.button(label="Newer", style=discord.ButtonStyle.secondary)
+    async def newer(self, ctx: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        await ctx.response.edit_message(embed=await self.render(), view=self)
+
+    @discord.ui.button(label="Older", style=discord.ButtonStyle.secondary)
+    async def older(self, ctx: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await ctx.response.edit_message(embed=await self.render(), view=self)
+
+@tree.command(name="history", description="List the transactions that changed a wallet's balance.")
+@app_commands.describe(wallet="The address or username of the wallet to look up. Deleted wallets can be looked up by address.", show="Display this message in the channel (usually this message is private).")
+@app_commands.autocomplete(wallet=wallet_autocomplete)
+async def history(ctx: discord.Interaction, wallet: str, show: bool=False):
+    profile = wallets.get(wallet)
+    if profile:
+        view = HistoryView(ctx.user.id, profile.address, profile.username or profile.address)
+    elif re.fullmatch(r"[0-9a-fA-F]{40}", wallet):
+        view = HistoryView(ctx.user.id, wallet, wallet)
+    else:
+        embed = discord.Embed(
+            title="Wallet Not Found",
+            description="That address or username does not exist.",
             color=discord.colour.Color.red()
         )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
+        embed.set_footer(text="Upgrading to SplatChain Next is recommended. See the /about command for more info.")
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
     
-    owned_by_user = []
-    for profile in profiles:
-        if profile["owner"] == f"discord/{ctx.user.name}":
-            owned_by_user.append(profile)
+    await ctx.response.send_message(embed=await view.render(), view=view, ephemeral=(not show))
+
+@tree.command(name="leaderboard", description="List the wallets with the most SPLC.")
+@app_commands.describe(top="How many wallets to list, up to 25.", type="Only rank wallets of this type.", wallet="The address or username of a wallet to find the rank of.", show="Display this message in the channel (usually this message is private).")
+@app_commands.choices(type=[
+    app_commands.Choice(name="Person", value="Person"),
+    app_commands.Choice(name="Business", value="Business")
+])
+@app_commands.autocomplete(wallet=wallet_autocomplete)
+async def leaderboard(ctx: discord.Interaction, top: app_commands.Range[int, 1, 25]=10, type: str="", wallet: str="", show: bool=False):
+    profile = None
+    if wallet:
+        profile = wallets.get(wallet)
+        if not profile:
+            await ctx.response.send_message("Could not find a wallet with that address or username.", ephemeral=True)
+            return
+    
+    embed=discord.Embed(
+        title=(f"Richest {type} Wallets" if type else "Richest Wallets"),
+        color=discord.colour.Color.green()
+    )
+    lines = []
+    for rank, ranked_profile in enumerate(wallets.richest(top, type or None), start=1):
+        lines.append(f"**{rank}.** {ranked_profile.nickname} ({ranked_profile.username}): {ranked_profile.balance:,} SPLC")
+    embed.description = "\n".join(lines) or "There are no wallets to rank yet."
+    
+    if profile:
+        if type and profile.type != type:
+            embed.add_field(name=f"Rank of {profile.username}", value=f"Not ranked, this is a {profile.type} wallet.", inline=False)
+        else:
+            rank, ranked = wallets.rank_of(profile, type or None)
+            embed.add_field(name=f"Rank of {profile.username}", value=f"#{rank:,} of {ranked:,} with {profile.balance:,} SPLC", inline=False)
+    
+    if not show:
+        embed.set_footer(text="To show this leaderboard to server members, rerun this command with 'show' set to true.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
+    
+    await ctx.response.send_message(embed=embed, ephemeral=(not show))
+
+debug_stats = os.getenv('DEBUG_STATS', "false") == "true"
+
+@tree.command(name="stats", description="Show statistics for the SplatChain economy.")
+@app_commands.describe(show="Display this message in the channel (usually this message is private).")
+async def stats(ctx: discord.Interaction, show: bool=False):
+    if debug_stats:
+        wallets.recount()
+    
+    embed=discord.Embed(
+        title="SplatChain Statistics",
+        color=discord.colour.Color.green()
+    )
+    embed.add_field(name="Total Supply", value=f"{wallets.total_balance:,} SPLC", inline=False)
+    embed.add_field(name="Wallets", value=f"{len(wallets):,} ({wallets.shared_count:,} with sharing enabled)", inline=False)
+    for type in ("Person", "Business"):
+        count, balance = wallets.type_totals.get(type, [0, 0])
+        embed.add_field(name=f"{type} Wallets", value=f"{count:,} holding {balance:,} SPLC", inline=False)
+    embed.add_field(name="Since the Bot Started", value=f"{transactions.injected:,} SPLC injected, {transactions.burned:,} SPLC burned, net {transactions.injected - transactions.burned:+,} SPLC", inline=False)
+    
+    if not show:
+        embed.set_footer(text="To show these statistics to server members, rerun this command with 'show' set to true.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
+    
+    await ctx.response.send_message(embed=embed, ephemeral=(not show))
+
+wallet_list_page_size = 10
+
+class WalletListView(discord.ui.View):
+    """Pages through one owner's wallets, rendering only the page being shown."""
+
+    def __init__(self, user_id, owner, title, footer):
+        super().__init__(timeout=300)
+        self.user_id = user_id
+        self.owner = owner
+        self.title = title
+        self.footer = footer
+        self.page = 0
+
+    def render(self):
+        count, total = wallets.owner_summary(self.owner)
+        pages = max((count + wallet_list_page_size - 1) // wallet_list_page_size, 1)
+        self.page = min(self.page, pages - 1)
+        
+        embed=discord.Embed(
+            title=self.title,
+            description=f"{count:,} wallets holding {total:,} SPLC",
+            color=discord.colour.Color.green()
+        )
+        embed.set_footer(text=(f"Page {self.page + 1} of {pages}\n" if pages > 1 else "") + self.footer)
+        
+        for profile in wallets.owned_page(self.owner, self.page * wallet_list_page_size, wallet_list_page_size):
+            if profile.share:
+                embed.add_field(name=f"{profile.nickname} ({profile.username})", value=f"Holds {profile.balance:,} SPLC | **Sharing Enabled**", inline=False)
+            else:
+                embed.add_field(name=f"{profile.nickname} ({profile.username})", value=f"Holds {profile.balance:,} SPLC", inline=False)
+        
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= pages - 1
+        return embed
+
+    async def interaction_check(self, ctx: discord.Interaction) -> bool:
+        return ctx.user.id == self.user_id
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, ctx: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        await ctx.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, ctx: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await ctx.response.edit_message(embed=self.render(), view=self)
+
+@tree.command(name="mywallets", description="List all wallets you own.")
+@app_commands.describe(show="Display this message in the channel (usually this message is private).")
+async def my_wallets(ctx: discord.Interaction, show: bool=False):
+    owner = f"discord/{ctx.user.name}"
     
-    if len(owned_by_user) == 0:
+    if wallets.owner_summary(owner)[0] == 0:
         embed = discord.Embed(
             title="No Wallets Owned",
             description="It seems that you don't own any wallets.",
@@ -667,70 +2876,40 @@ async def my_wallets(ctx: discord.Interaction, show: bool=False):
         await ctx.response.send_message(embed=embed, ephemeral=True)
         return
     else:
-        embed=discord.Embed(
-            title=("Your Wallets" if not show else f"{ctx.user.name}'s Wallets"),
-            color=discord.colour.Color.green()
-        )
-        
         if show:
-            embed.set_footer(text="To see details for a wallet, use the /info command.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
+            footer = "To see details for a wallet, use the /info command.\nUpgrading to SplatChain Next is recommended. See the /about command for more info."
         else:
-            embed.set_footer(text="To see details for a wallet, use the /info command.\nRerun this command with 'show' set to true to display this message in the channel.\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
+            footer = "To see details for a wallet, use the /info command.\nRerun this command with 'show' set to true to display this message in the channel.\nUpgrading to SplatChain Next is recommended. See the /about command for more info."
         
-        for profile in owned_by_user:
-            if profile['share']:
-                embed.add_field(name=f"{profile['nickname']} ({profile['username']})", value=f"Holds {int(profile['balance']):,} SPLC | **Sharing Enabled**", inline=False)
-            else:
-                embed.add_field(name=f"{profile['nickname']} ({profile['username']})", value=f"Holds {int(profile['balance']):,} SPLC", inline=False)
-            
-        await ctx.response.send_message(embed=embed, ephemeral=(not show))
+        view = WalletListView(ctx.user.id, owner, ("Your Wallets" if not show else f"{ctx.user.name}'s Wallets"), footer)
+        await ctx.response.send_message(embed=view.render(), view=view, ephemeral=(not show))
 
 @tree.command(name="userwallets", description="List all wallets owned by a user.")
 @app_commands.describe(user="The user to list wallets for.", show="Display this message in the channel (usually this message is private).")
 async def user_wallets(ctx: discord.Interaction, user: discord.User, show: bool=False):
-    if user_block_check(ctx.user):
-        embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
-            color=discord.colour.Color.red()
-        )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-        await ctx.response.send_message(embed=embed, ephemeral=True)
-        return
-    
-    owned_by_user = []
-    for profile in profiles:
-        if profile["owner"] == f"discord/{user.name}":
-            owned_by_user.append(profile)
+    owner = f"discord/{user.name}"
     
-    if len(owned_by_user) == 0:
+    if wallets.owner_summary(owner)[0] == 0:
         await ctx.response.send_message("That user does not own any wallets.", ephemeral=True)
         return
     else:
-        embed=discord.Embed(
-            title=f"{user.name}'s Wallets",
-            color=discord.colour.Color.green()
-        )
-        embed.set_footer(text="To see details for a wallet, use the /info command.\nWARNING: Performing any destructive action on someone else's wallet will notify them!\nUpgrading to SplatChain Next is recommended. See the /about command for more info.")
-        for profile in owned_by_user:
-            if profile['share']:
-                embed.add_field(name=f"{profile['nickname']} ({profile['username']})", value=f"Holds {int(profile['balance']):,} SPLC | **Sharing Enabled**", inline=False)
-            else:
-                embed.add_field(name=f"{profile['nickname']} ({profile['username']})", value=f"Holds {int(profile['balance']):,} SPLC", inline=False)
-        await ctx.response.send_message(embed=embed, ephemeral=(not show))
-        
-@tree.command(name="testdm", description="Send a test DM to yourself.")
-async def test_dm(ctx: discord.Interaction):
-    if user_block_check(ctx.user):
-        embed=discord.Embed(
-            title="BANNED",
-            description="You violated the SplatChain Bot Terms and are banned from using the bot.",
-            color=discord.colour.Color.red()
-        )
-        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-        await ctx.response.send_message(embed=embed, ephemeral=True)
+        footer = "To see details for a wallet, use the /info command.\nWARNING: Performing any destructive action on someone else's wallet will notify them!\nUpgrading to SplatChain Next is recommended. See the /about command for more info."
+        view = WalletListView(ctx.user.id, owner, f"{user.name}'s Wallets", footer)
+        await ctx.response.send_message(embed=view.render(), view=view, ephemeral=(not show))
+
+@tree.command(name="profiler", description="Profile upcoming commands, saves and reloads. Only the bot's owner can use this.")
+@app_commands.describe(commands="How many of the next commands to profile with cProfile.", memory="How many of the next saves or reloads to trace with tracemalloc.")
+async def profiler_command(ctx: discord.Interaction, commands: app_commands.Range[int, 0, 100]=0, memory: app_commands.Range[int, 0, 100]=0):
+    if not is_bot_owner(ctx.user):
+        await ctx.response.send_message("Only the bot's owner can use this command.", ephemeral=True)
         return
     
+    profiler.commands_left = commands
+    profiler.memory_left = memory
+    await ctx.response.send_message(f"Profiling the next {commands} commands and tracing the next {memory} saves or reloads. Reports are written to {profiles_dir}.", ephemeral=True)
+
+@tree.command(name="testdm", description="Send a test DM to yourself.")
+async def test_dm(ctx: discord.Interaction):
     try:
         await ctx.user.send("This is a test DM from the SplatChain bot.")
         await ctx.response.send_message("Test DM sent! Check your DMs.", ephemeral=True)
@@ -747,37 +2926,256 @@ async def test_dm(ctx: discord.Interaction):
         
 @tasks.loop(minutes=5)
 async def periodic_reload_db():
-    reload_db()
-    load_block_list()
-    print("Database reloaded.")
+    async with profiler.trace_memory("reload"):
+        await reload_db()
+    if debug_stats:
+        wallets.recount()
+    await load_block_list()
+
+@tasks.loop(seconds=shared_db_poll_interval)
+async def shared_db_poller():
+    await sync_shared_db()
     
-@tasks.loop(minutes=5)
-async def server_block_check():
-    already_pinged_owners = []
-    
-    if os.getenv('LBS_BLOCK_LIST') == "true" and os.getenv('LBS_BLOCK_SERVERS') == "true":
-        for guild in bot.guilds:
-            if guild.owner.name in block_list['blocked_usernames'] or guild.owner.id in block_list['blocked_user_ids']:
-                if not guild.owner.id in already_pinged_owners:
-                    print(f"Owner of {guild.name} is on the block list. Kicking the bot.")
-                    embed=discord.Embed(
-                    title="This bot has left all of your servers.",
-                    description=f"You have been banned from the SplatChain Bot due to a violation of its TOS.\nThis bot has left any servers you own.",
-                    color=discord.colour.Color.red()
-                    )
-                    embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-                    await guild.owner.send(embed=embed)
-                    already_pinged_owners.append(guild.owner.id)
-                    await guild.leave()
-            elif guild.id in block_list['blocked_servers']:
-                print(f"{guild.name} is on the block list. Kicking the bot.")
-                embed=discord.Embed(
-                    title=f"This bot has left {guild.name}.",
-                    description="Your server has been deemed unacceptable according to the SplatChain Bot Terms.\nThis bot has left your server.",
-                    color=discord.colour.Color.red()
-                )
-                embed.set_footer(text="If you wish to appeal, DM littlebit670.")
-                await guild.owner.send(embed=embed)
-                await guild.leave()
+@tasks.loop(minutes=1)
+async def journal_compactor():
+    if journal_started is None or not os.path.exists(journal_file):
+        return
+    
+    journal_size = os.path.getsize(journal_file)
+    if journal_size < journal_max_bytes and time.monotonic() - journal_started < journal_max_age * 60:
+        return
+    
+    # Copy the list of wallets now; their rows are built and written in db_executor while commands keep running.
+    # Journal appends go through the same executor, so everything already in the journal when the
+    # compaction starts is in the snapshot, and a change made meanwhile is appended again after it.
+    profiles = list(wallets)
+    await asyncio.get_running_loop().run_in_executor(db_executor, fold_journal, profiles)
+    print(f"Journal compacted ({journal_size:,} bytes folded into the database).")
+
+def fold_journal(profiles):
+    global journal_started
+    write_snapshot(profile.to_row() for profile in profiles)
+    open(journal_file, "w").close()
+    backend.file_stats = backend._stat_files()
+    journal_started = None
+
+server_block_concurrency = 8 # servers checked at once during a sweep
+
+async def server_block_check(guild: discord.Guild, pinged_owners: set):
+    """Leaves the server if it or its owner is on the block list."""
+    owner = guild.owner or bot.get_user(guild.owner_id)
+    if owner is None and compiled_block_list.usernames:
+        # Only needed for the username check; a blocked ID is enough on its own
+        try:
+            owner = await bot.fetch_user(guild.owner_id)
+        except discord.HTTPException:
+            pass
+    
+    if guild.owner_id in compiled_block_list.user_ids or (owner and owner.name in compiled_block_list.usernames):
+        print(f"Owner of {guild.name} is on the block list. Kicking the bot.")
+        if guild.owner_id not in pinged_owners:
+            pinged_owners.add(guild.owner_id)
+            embed=discord.Embed(
+                title="This bot has left all of your servers.",
+                description=f"You have been banned from the SplatChain Bot due to a violation of its TOS.\nThis bot has left any servers you own.",
+                color=discord.colour.Color.red()
+            )
+            embed.set_footer(text="If you wish to appeal, DM littlebit670.")
+            await send_block_notice(guild, owner, embed)
+        await guild.leave()
+    elif guild.id in compiled_block_list.servers:
+        print(f"{guild.name} is on the block list. Kicking the bot.")
+        embed=discord.Embed(
+            title=f"This bot has left {guild.name}.",
+            description="Your server has been deemed unacceptable according to the SplatChain Bot Terms.\nThis bot has left your server.",
+            color=discord.colour.Color.red()
+        )
+        embed.set_footer(text="If you wish to appeal, DM littlebit670.")
+        await send_block_notice(guild, owner, embed)
+        await guild.leave()
+
+async def send_block_notice(guild, owner, embed):
+    # The bot leaves either way, so a closed DM shouldn't stop it
+    try:
+        if owner is None:
+            owner = await bot.fetch_user(guild.owner_id)
+        await owner.send(embed=embed)
+    except discord.HTTPException:
+        print(f"Could not send DM to the owner of {guild.name}.")
+
+async def server_block_sweep():
+    """Checks every server the bot is in, several at a time."""
+    pinged_owners = set()
+    semaphore = asyncio.Semaphore(server_block_concurrency)
+    
+    async def check(guild):
+        async with semaphore:
+            try:
+                await server_block_check(guild, pinged_owners)
+            except Exception as e:
+                print(f"Could not check {guild.name} against the block list: {e}")
+    
+    await asyncio.gather(*(check(guild) for guild in list(bot.guilds)))
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    if block_servers_enabled:
+        await server_block_check(guild, set())
+
+# Importing and exporting
+def detect_format(path, file_format=None):
+    if file_format:
+        return file_format
+    return "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+
+def read_import_file(path, file_format):
+    """Yields rows from a CSV or JSON Lines file as the string rows profile_validator expects."""
+    with open(path, "r", newline='') as import_file:
+        if file_format == "jsonl":
+            records = (json.loads(line) for line in import_file if line.strip())
+        else:
+            # Cheaper than csv.DictReader, which matters at a million rows
+            reader = csv.reader(import_file)
+            header = next(reader, [])
+            records = (dict(zip(header, values)) for values in reader)
+        
+        for record in records:
+            profile = {column: str(record.get(column) or "") for column in SQLiteBackend.columns}
+            profile['type'] = profile['type'] or "Person"
+            profile['balance'] = profile['balance'] or "0"
+            profile['share'] = record.get('share') in (True, "True", "true")
+            yield profile
+
+def validate_stream(profiles, taken_addresses, taken_usernames, counts):
+    """validate_db for rows that arrive one at a time: each row is checked, deduplicated and passed on straight away."""
+    for profile in profiles:
+        counts['read'] += 1
+        # Rows being seeded usually have no address yet, which isn't worth a warning
+        if not profile['address']:
+            profile['address'] = generate_address(taken_addresses)
+            counts['generated'] += 1
+        profile_validator(profile, taken_addresses)
+        
+        if profile['address'] in taken_addresses or (profile['username'] and profile['username'] in taken_usernames):
+            counts['duplicates'] += 1
+            continue
+        taken_addresses.add(profile['address'])
+        if profile['username']:
+            taken_usernames.add(profile['username'])
+        counts['imported'] += 1
+        yield profile
+
+lock_file = "./data/splatchain.lock" # locked by every running bot process, so the import tool can tell the bot is running
+
+def lock_data(exclusive=False):
+    """Locks lock_file, shared for a running bot or exclusive for an import the bot would overwrite.
+
+    Returns the open lock file, which holds the lock until it is closed, or None if an exclusive lock is taken elsewhere.
+    A bot waits for an import to finish instead. flock works across containers that share ./data, unlike process IDs.
+    """
+    os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+    lock = open(lock_file, "a")
+    try:
+        import fcntl
+    except ImportError:
+        return lock # Windows has no flock, so the import tool can't tell whether the bot is running there
+    
+    try:
+        fcntl.flock(lock, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+    except BlockingIOError:
+        if exclusive:
+            lock.close()
+            return None
+        print("Waiting for an import to finish")
+        fcntl.flock(lock, fcntl.LOCK_SH)
+    return lock
+
+def import_wallets(path, file_format=None, replace=False):
+    """Adds the wallets in path to the database, or replaces the database with them."""
+    file_format = detect_format(path, file_format)
+    open_backend()
+    # The bot rewrites splatwallet.csv (or folds its journal into it) from memory, which would undo the import.
+    # The lock is held until the import exits, so a bot started meanwhile waits for it.
+    if isinstance(backend, CSVBackend) and lock_data(exclusive=True) is None:
+        sys.exit("The bot is running and would overwrite the imported wallets with its next save. Stop the bot and try again.")
+    started = time.perf_counter()
+    
+    taken_addresses = set()
+    taken_usernames = set()
+    if not replace:
+        for profile in backend.iter_rows():
+            taken_addresses.add(profile['address'])
+            if profile['username']:
+                taken_usernames.add(profile['username'])
+    
+    counts = {"read": 0, "generated": 0, "duplicates": 0, "imported": 0}
+    profiles = validate_stream(read_import_file(path, file_format), taken_addresses, taken_usernames, counts)
+    if replace:
+        backend.replace_all(profiles)
+    else:
+        backend.add_all(profiles)
+    
+    print(f"Imported {counts['imported']:,} of {counts['read']:,} wallets from {path} in {time.perf_counter() - started:.1f}s. "
+        f"Generated {counts['generated']:,} addresses and skipped {counts['duplicates']:,} duplicates.")
+
+def export_wallets(path, file_format=None):
+    """Writes every wallet in the database to path as CSV or JSON Lines."""
+    file_format = detect_format(path, file_format)
+    open_backend()
+    started = time.perf_counter()
+    
+    exported = 0
+    # Written to a temporary file first, like write_snapshot, so a failed export never leaves half a file
+    temp_file = path + ".tmp"
+    with open(temp_file, "w", newline='') as export_file:
+        if file_format == "jsonl":
+            for profile in backend.iter_rows():
+                export_file.write(json.dumps(Wallet.from_row(profile).fields()) + "\n")
+                exported += 1
+        else:
+            writer = csv.DictWriter(export_file, fieldnames=SQLiteBackend.columns, extrasaction="ignore")
+            writer.writeheader()
+            for profile in backend.iter_rows():
+                writer.writerow(profile)
+                exported += 1
+    os.replace(temp_file, path)
+    print(f"Exported {exported:,} wallets to {path} in {time.perf_counter() - started:.1f}s.")
+
+# Docker stops containers with SIGTERM; treat it like Ctrl+C so the bot shuts down cleanly
+def handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    global startup_started
+    if len(sys.argv) > 1:
+        run_tool(sys.argv[1:])
+        return
+    
+    startup_started = time.perf_counter()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    with lock_data():
+        bot.run(os.getenv('BOT_TOKEN'))
+        
+        # Save anything still waiting to be written
+        db_executor.shutdown(wait=True)
+        change_writer.flush_now()
+
+def run_tool(args):
+    parser = argparse.ArgumentParser(prog="python -m splatchain_discord", description="Run the bot, or import or export wallets without starting it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Add wallets from a CSV or JSON Lines file to the database.")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"], help="The file's format (default: from its extension).")
+    import_parser.add_argument("--replace", action="store_true", help="Replace every wallet in the database instead of adding to them.")
+    export_parser = commands.add_parser("export", help="Write every wallet in the database to a CSV or JSON Lines file.")
+    export_parser.add_argument("file")
+    export_parser.add_argument("--format", choices=["csv", "jsonl"], help="The file's format (default: from its extension).")
+    args = parser.parse_args(args)
+    
+    if args.command == "import":
+        import_wallets(args.file, args.format, args.replace)
+    else:
+        export_wallets(args.file, args.format)
 
-bot.run(os.getenv('BOT_TOKEN'))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file